@@ -0,0 +1,92 @@
+"""Measure the startup time of the CLI and guard it against regressions.
+
+Heavy dependencies (torch via keybert, moviepy, boto3, nltk, openai, ...) are
+imported on first use. This benchmark fails if any of them is imported just by
+loading main.py, or if `main.py --help` takes longer than the given budget.
+
+Usage: python benchmarks/startup_time.py [--runs 10] [--max-seconds 1.0]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+_REPO_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_LAZY_MODULES: List[str] = [
+    "keybert",
+    "torch",
+    "sentence_transformers",
+    "moviepy.editor",
+    "moviepy.config",
+    "boto3",
+    "botocore",
+    "nltk",
+    "openai",
+    "gtts",
+    "pydub",
+    "fpdf",
+]
+
+
+def measure_help(runs: int) -> List[float]:
+    """Returns: The wall time of every `main.py --help` run, in seconds"""
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "main.py", "--help"],
+            cwd=_REPO_DIR,
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def find_eager_modules() -> List[str]:
+    """Returns: The lazy modules that are imported by loading main.py"""
+    script = (
+        "import json, sys, runpy\n"
+        "runpy.run_path('main.py', run_name='benchmark')\n"
+        f"print(json.dumps([m for m in {_LAZY_MODULES!r} if m in sys.modules]))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=_REPO_DIR,
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+    return json.loads(result.stdout.decode().strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=1.0,
+        help="Fail if the median `main.py --help` time is above this.",
+    )
+    args = parser.parse_args()
+
+    eager_modules = find_eager_modules()
+    durations = measure_help(args.runs)
+    median = statistics.median(durations)
+    print(
+        f"main.py --help: median {median:.3f}s, "
+        f"min {min(durations):.3f}s, max {max(durations):.3f}s ({args.runs} runs)"
+    )
+
+    failed = False
+    if eager_modules:
+        print(f"FAIL: imported at startup: {', '.join(eager_modules)}")
+        failed = True
+    if median > args.max_seconds:
+        print(f"FAIL: median startup time is above {args.max_seconds:.3f}s")
+        failed = True
+    sys.exit(1 if failed else 0)
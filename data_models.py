@@ -1,7 +1,10 @@
+import hashlib
 from dataclasses import dataclass
 from enum import Enum
-from typing import List
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
 
+import PIL.Image
 from PIL.Image import Image
 
 
@@ -36,9 +39,29 @@ class StorySize(Enum):
 @dataclass
 class StoryPageContent:
     sentence: str
-    image: Image
+    # None until get_image() is called, the image is then read from image_path.
+    image: Optional[Image]
     image_path: str
     page_number: str
+    # Computed once when the image is created, None for stories saved before that.
+    dominant_color: Optional[Tuple[int, int, int]] = None
+    # The SHA-256 of the image file, checked when the image is read from it.
+    image_sha256: Optional[str] = None
+
+    def get_image(self) -> Image:
+        """Returns: The image of the page, read from image_path on first use"""
+        if self.image is None:
+            with open(self.image_path, "rb") as file:
+                image_data = file.read()
+            if (
+                self.image_sha256
+                and hashlib.sha256(image_data).hexdigest() != self.image_sha256
+            ):
+                raise RuntimeError(f"The image was modified: {self.image_path}")
+            image = PIL.Image.open(BytesIO(image_data))
+            image.load()
+            self.image = image
+        return self.image
 
 
 @dataclass
@@ -64,10 +87,27 @@ class AudioInfo:
 @dataclass
 class StoryPage:
     page_content: StoryPageContent
-    page_image: Image
+    # None once the page is released from memory, it is then read from its file.
+    page_image: Optional[Image]
     page_filepath: str
     audio: AudioInfo
 
+    def get_page_image(self) -> Image:
+        """Returns: The rendered page, read from page_filepath if it was released.
+        A page that is read is not kept, it lives as long as the caller keeps it."""
+        if self.page_image is not None:
+            return self.page_image
+        page_image = PIL.Image.open(self.page_filepath)
+        page_image.load()
+        return page_image
+
+    def get_page_size(self) -> Tuple[int, int]:
+        """Returns: The (width, height) of the page, without decoding a released page"""
+        if self.page_image is not None:
+            return self.page_image.size
+        with PIL.Image.open(self.page_filepath) as page_image:
+            return page_image.size
+
 
 @dataclass
 class Story:
@@ -85,3 +125,35 @@ class CombinedWorkdir:
     workdir_images: str
     workdir_pages: str
     workdir_audio: str
+
+
+@dataclass
+class VideoRendition:
+    """The encoder settings of one output video of the story."""
+
+    name: str
+    # The video height in pixels, the width keeps the aspect ratio. None keeps the
+    # page size.
+    height: Optional[int] = None
+    preset: str = "medium"
+    # Constant quality, None uses the encoder default. Ignored if bitrate is set.
+    crf: Optional[int] = None
+    # Target bitrate e.g. "2M", None to use the crf.
+    bitrate: Optional[str] = None
+    # Encoder threads, None lets the encoder decide.
+    threads: Optional[int] = None
+
+    @staticmethod
+    def get_rendition_from_str(rendition: str) -> "VideoRendition":
+        """Parse a rendition such as "720p:height=720,preset=fast,crf=20"."""
+        name, _, settings = rendition.partition(":")
+        values: Dict[str, Any] = {}
+        for setting in filter(None, settings.split(",")):
+            key, _, value = setting.partition("=")
+            if key in ("height", "crf", "threads"):
+                values[key] = int(value)
+            elif key in ("preset", "bitrate"):
+                values[key] = value
+            else:
+                raise RuntimeError(f"Unknown video rendition setting: {key}")
+        return VideoRendition(name=name, **values)
@@ -1,13 +1,20 @@
 import os
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 
 from mutagen.mp3 import MP3
 
 from data_models import AudioInfo, StoryPageContent
+from util.disk_cache import DiskCache
 
 
 class AbstractAudioGenerator(ABC):
-    @abstractmethod
+    _AUDIO_CACHE_EXT: str = ".mp3"
+
+    def __init__(self, audio_cache: Optional[DiskCache] = None):
+        self.audio_cache = audio_cache
+
     def generate_audio(
         self, workdir: str, story_page_content: StoryPageContent
     ) -> AudioInfo:
@@ -19,8 +26,108 @@ class AbstractAudioGenerator(ABC):
 
         Returns: AudioInfo object with filepath and length.
         """
+        mp3_filepath = self._get_mp3_filepath(workdir, story_page_content)
+        cached_audio = self._get_cached_audio(story_page_content, mp3_filepath)
+        if cached_audio:
+            return cached_audio
+
+        print(f"Generating audio for: {story_page_content.sentence}")
+        self._synthesize(text=story_page_content.sentence, mp3_filepath=mp3_filepath)
+        audio = AudioInfo(
+            mp3_file=mp3_filepath,
+            length_in_seconds=self._get_length_in_seconds(mp3_filepath),
+        )
+        self._cache_audio(story_page_content, audio)
+        return audio
+
+    def generate_audios(
+        self,
+        workdir: str,
+        story_page_contents: List[StoryPageContent],
+        max_workers: int = 1,
+    ) -> List[AudioInfo]:
+        """Generate the audio of all the given story pages
+
+        Args:
+            workdir: The workdir where to save the audio files
+            story_page_contents: The contents of the story pages
+            max_workers: The maximum number of pages to synthesize in parallel
+
+        Returns: AudioInfo objects, in the same order as the given pages
+        """
+        if max_workers <= 1:
+            return [
+                self.generate_audio(workdir=workdir, story_page_content=page_content)
+                for page_content in story_page_contents
+            ]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(
+                executor.map(
+                    lambda page_content: self.generate_audio(
+                        workdir=workdir, story_page_content=page_content
+                    ),
+                    story_page_contents,
+                )
+            )
+
+    @abstractmethod
+    def _synthesize(self, text: str, mp3_filepath: str) -> None:
+        """Preform text to speech for the given text
+
+        Args:
+            text: The text to convert to speech
+            mp3_filepath: Where to save the mp3 audio
+
+        Returns: Nothing
+        """
+        pass
+
+    @abstractmethod
+    def _get_cache_key_parts(self, text: str) -> List[str]:
+        """Returns: Everything that affects the audio of the given text, starting
+        with the backend name. Used as the key of the audio cache."""
         pass
 
+    def _get_cached_audio(
+        self, story_page_content: StoryPageContent, mp3_filepath: str
+    ) -> Optional[AudioInfo]:
+        """Copy the cached audio of the given page to mp3_filepath, if there is one
+
+        Returns: AudioInfo object on a cache hit, None otherwise
+        """
+        if not self.audio_cache:
+            return None
+        cache_key = self._get_cache_key(story_page_content)
+        if not self.audio_cache.get_copy(
+            cache_key, self._AUDIO_CACHE_EXT, mp3_filepath
+        ):
+            return None
+
+        print(f"Using cached audio for: {story_page_content.sentence}")
+        metadata = self.audio_cache.read_json(cache_key)
+        length_in_seconds = (
+            metadata["length_in_seconds"]
+            if metadata
+            else self._get_length_in_seconds(mp3_filepath)
+        )
+        return AudioInfo(mp3_file=mp3_filepath, length_in_seconds=length_in_seconds)
+
+    def _cache_audio(
+        self, story_page_content: StoryPageContent, audio: AudioInfo
+    ) -> None:
+        if not self.audio_cache:
+            return
+        cache_key = self._get_cache_key(story_page_content)
+        self.audio_cache.put_json(
+            cache_key, {"length_in_seconds": audio.length_in_seconds}
+        )
+        self.audio_cache.put(cache_key, self._AUDIO_CACHE_EXT, audio.mp3_file)
+
+    def _get_cache_key(self, story_page_content: StoryPageContent) -> str:
+        return DiskCache.make_key(
+            *self._get_cache_key_parts(story_page_content.sentence)
+        )
+
     @staticmethod
     def _get_length_in_seconds(mp3_filepath: str) -> float:
         return MP3(mp3_filepath).info.length
@@ -1,71 +1,263 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from xml.sax.saxutils import escape
+
 from data_models import StoryPageContent, AudioInfo
 from generators.audio_generator_abstract import AbstractAudioGenerator
 
-from boto3 import Session
-from botocore.exceptions import BotoCoreError, ClientError
 from contextlib import closing
 
 from util.aws_polly_credentials_provider import AwsPollyCredentialsProvider
+from util.disk_cache import DiskCache
 
 
 class AudioGeneratorPolly(AbstractAudioGenerator):
+    _BACKEND: str = "polly"
     _ENGINE_NEUTRAL: str = "neural"
     _VOICE_ID: str = "Kevin"
     _OUTPUT_FORMAT_MP3: str = "mp3"
     _LANGUAGE_CODE_EN_US: str = "en-US"
     _SPEED: str = "x-slow"
     _TEXT_TYPE_SSML: str = "ssml"
+    _DEFAULT_MAX_CONNECTIONS: int = 4
+    _RETRY_MODE_ADAPTIVE: str = "adaptive"
+    _MAX_RETRY_ATTEMPTS: int = 8
+    _OUTPUT_FORMAT_SPEECH_MARKS: str = "json"
+    _SPEECH_MARK_TYPE_SSML: str = "ssml"
+    # Polly accepts at most 6000 characters per request, including SSML tags,
+    # of which at most 3000 can be billed (text) characters.
+    _MAX_SSML_LENGTH: int = 6000
+    _MAX_BILLED_CHARACTERS: int = 3000
+    _BATCH_FILENAME: str = "audio_batch_{}.mp3"
+
+    def __init__(
+        self,
+        aws_polly_credentials_provider: Optional[AwsPollyCredentialsProvider],
+        max_connections: int = _DEFAULT_MAX_CONNECTIONS,
+        audio_cache: Optional[DiskCache] = None,
+        batch_synthesis: bool = False,
+        polly_client=None,
+    ):
+        """
+        Args:
+            aws_polly_credentials_provider: Used to create the Polly client, unused if
+                polly_client is given
+            max_connections: The maximum number of parallel requests to Polly
+            audio_cache: Optional cache of synthesized audio
+            batch_synthesis: Synthesize many pages per request and split the audio
+                using speech marks
+            polly_client: A Polly client to use instead of creating one, e.g.
+                util.local_polly_client.LocalPollyClient for offline runs
+        """
+        super().__init__(audio_cache=audio_cache)
+        self.max_connections = max_connections
+        self.batch_synthesis = batch_synthesis
+        if polly_client is not None:
+            self.polly = polly_client
+            return
+        if aws_polly_credentials_provider is None:
+            raise RuntimeError("AWS Polly credentials are required to create a client")
+
+        # boto3 is imported on first use, offline runs don't need it.
+        from boto3 import Session
+        from botocore.config import Config
 
-    def __init__(self, aws_polly_credentials_provider: AwsPollyCredentialsProvider):
         self.session = Session(
             aws_access_key_id=aws_polly_credentials_provider.access_key,
             aws_secret_access_key=aws_polly_credentials_provider.secret_key,
         )
-        self.polly = self.session.client("polly")
+        # A single client (and connection pool) is shared by all the requests.
+        # The adaptive retry mode backs off client side when Polly throttles.
+        self.polly = self.session.client(
+            "polly",
+            config=Config(
+                max_pool_connections=max_connections,
+                retries={
+                    "mode": self._RETRY_MODE_ADAPTIVE,
+                    "max_attempts": self._MAX_RETRY_ATTEMPTS,
+                },
+            ),
+        )
+
+    def generate_audios(
+        self,
+        workdir: str,
+        story_page_contents: List[StoryPageContent],
+        max_workers: int = 1,
+    ) -> List[AudioInfo]:
+        # Never run more requests in parallel than there are pooled connections.
+        max_workers = min(max_workers, self.max_connections)
+        if not self.batch_synthesis:
+            return super().generate_audios(
+                workdir=workdir,
+                story_page_contents=story_page_contents,
+                max_workers=max_workers,
+            )
+
+        audios: Dict[str, AudioInfo] = {}
+        missing_pages = []
+        for page_content in story_page_contents:
+            cached_audio = self._get_cached_audio(
+                page_content, self._get_mp3_filepath(workdir, page_content)
+            )
+            if cached_audio:
+                audios[page_content.page_number] = cached_audio
+            else:
+                missing_pages.append(page_content)
+
+        batches = self._split_batches(missing_pages)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            for batch_audios in executor.map(
+                lambda batch: self._synthesize_batch(workdir, batch), batches
+            ):
+                audios.update(batch_audios)
 
-    def generate_audio(
-        self, workdir: str, story_page_content: StoryPageContent
-    ) -> AudioInfo:
-        print(f"Generating audio for: {story_page_content.sentence}")
-        response = self._call_polly(story_page_content.sentence)
+        return [
+            audios[page_content.page_number] for page_content in story_page_contents
+        ]
+
+    def _synthesize(self, text: str, mp3_filepath: str) -> None:
+        response = self._call_polly(text)
 
         # Access the audio stream from the response
         if response and "AudioStream" in response:
-            mp3_filepath = self._handle_polly_response(
-                workdir, story_page_content, response
-            )
-            length_in_seconds = self._get_length_in_seconds(mp3_filepath)
-            return AudioInfo(mp3_filepath, length_in_seconds)
+            self._handle_polly_response(mp3_filepath, response)
         else:
             # The response didn't contain audio data, exit gracefully
             raise RuntimeError(
                 f"Error performing text to speech using Polly, could not stream audio"
             )
 
+    def _get_cache_key_parts(self, text: str) -> List[str]:
+        return [
+            self._BACKEND,
+            self._VOICE_ID,
+            self._ENGINE_NEUTRAL,
+            self._SPEED,
+            self._LANGUAGE_CODE_EN_US,
+            # A page sliced out of a batch sounds different than a page on its own.
+            f"batch={self.batch_synthesis}",
+            self._construct_ssml(text=text),
+        ]
+
+    def _split_batches(
+        self, story_page_contents: List[StoryPageContent]
+    ) -> List[List[StoryPageContent]]:
+        """Group consecutive pages in batches that fit in a single Polly request"""
+        batches: List[List[StoryPageContent]] = []
+        current_batch: List[StoryPageContent] = []
+        for page_content in story_page_contents:
+            candidate = current_batch + [page_content]
+            billed_characters = sum(
+                len(candidate_page.sentence) + 1 for candidate_page in candidate
+            )
+            if current_batch and (
+                len(self._construct_batch_ssml(candidate)) > self._MAX_SSML_LENGTH
+                or billed_characters > self._MAX_BILLED_CHARACTERS
+            ):
+                batches.append(current_batch)
+                candidate = [page_content]
+            current_batch = candidate
+        if current_batch:
+            batches.append(current_batch)
+        return batches
+
+    def _synthesize_batch(
+        self, workdir: str, story_page_contents: List[StoryPageContent]
+    ) -> Dict[str, AudioInfo]:
+        """Synthesize the given pages with one audio request and one speech marks
+        request, then slice the audio into one mp3 file per page.
+
+        Returns: The audio of every page by page number
+        """
+        print(f"Generating audio for {len(story_page_contents)} pages in one request")
+        ssml = self._construct_batch_ssml(story_page_contents)
+
+        marks_response = self._call_polly_ssml(
+            ssml,
+            OutputFormat=self._OUTPUT_FORMAT_SPEECH_MARKS,
+            SpeechMarkTypes=[self._SPEECH_MARK_TYPE_SSML],
+        )
+        audio_response = self._call_polly_ssml(
+            ssml, OutputFormat=self._OUTPUT_FORMAT_MP3
+        )
+        if not (
+            marks_response
+            and "AudioStream" in marks_response
+            and audio_response
+            and "AudioStream" in audio_response
+        ):
+            raise RuntimeError(
+                f"Error performing text to speech using Polly, could not stream audio"
+            )
+
+        with closing(marks_response["AudioStream"]) as stream:
+            speech_marks = [
+                json.loads(line)
+                for line in stream.read().decode("utf-8").splitlines()
+                if line.strip()
+            ]
+        mark_times = {
+            mark["value"]: mark["time"]
+            for mark in speech_marks
+            if mark["type"] == self._SPEECH_MARK_TYPE_SSML
+        }
+
+        batch_filepath = os.path.join(
+            workdir, self._BATCH_FILENAME.format(story_page_contents[0].page_number)
+        )
+        self._handle_polly_response(batch_filepath, audio_response)
+        from pydub import AudioSegment
+
+        batch_audio = AudioSegment.from_mp3(batch_filepath)
+
+        audios: Dict[str, AudioInfo] = {}
+        for i, page_content in enumerate(story_page_contents):
+            start = mark_times[self._get_mark_name(page_content)]
+            end = (
+                mark_times[self._get_mark_name(story_page_contents[i + 1])]
+                if i + 1 < len(story_page_contents)
+                else len(batch_audio)
+            )
+            mp3_filepath = self._get_mp3_filepath(workdir, page_content)
+            batch_audio[start:end].export(mp3_filepath, format=self._OUTPUT_FORMAT_MP3)
+            audio = AudioInfo(mp3_filepath, self._get_length_in_seconds(mp3_filepath))
+            self._cache_audio(page_content, audio)
+            audios[page_content.page_number] = audio
+
+        os.remove(batch_filepath)
+        return audios
+
     def _call_polly(self, text: str):
+        return self._call_polly_ssml(
+            self._construct_ssml(text=text), OutputFormat=self._OUTPUT_FORMAT_MP3
+        )
+
+    def _call_polly_ssml(self, ssml: str, **kwargs):
+        from botocore.exceptions import BotoCoreError, ClientError
+
         try:
             # Request speech synthesis
             return self.polly.synthesize_speech(
                 Engine=self._ENGINE_NEUTRAL,
                 TextType=self._TEXT_TYPE_SSML,
-                Text=self._construct_ssml(text=text),
-                OutputFormat=self._OUTPUT_FORMAT_MP3,
+                Text=ssml,
                 VoiceId=self._VOICE_ID,
                 LanguageCode=self._LANGUAGE_CODE_EN_US,
+                **kwargs,
             )
         except (BotoCoreError, ClientError) as error:
             print(f"Error performing text to speech using Polly: {error}")
             return None
 
-    def _handle_polly_response(
-        self, workdir: str, story_page_content: StoryPageContent, response
-    ) -> str:
+    def _handle_polly_response(self, mp3_filepath: str, response) -> None:
         # Note: Closing the stream is important because the service throttles on the
         # number of parallel connections. Here we are using contextlib.closing to
         # ensure the close method of the stream object will be called automatically
         # at the end of the with statement's scope.
         with closing(response["AudioStream"]) as stream:
-            mp3_filepath = self._get_mp3_filepath(workdir, story_page_content)
             try:
                 # Open a file for writing the output as a binary stream
                 with open(mp3_filepath, "wb") as file:
@@ -76,7 +268,18 @@ class AudioGeneratorPolly(AbstractAudioGenerator):
                     f"Error performing text to speech using Polly, could not write to file: {error}"
                 )
 
-        return mp3_filepath
-
     def _construct_ssml(self, text: str):
         return f'<speak><prosody rate="{self._SPEED}">{text}.</prosody></speak>'
+
+    def _construct_batch_ssml(self, story_page_contents: List[StoryPageContent]):
+        """A single SSML document with a mark before the sentence of every page"""
+        sentences = " ".join(
+            f'<mark name="{self._get_mark_name(page_content)}"/>'
+            f"{escape(page_content.sentence)}."
+            for page_content in story_page_contents
+        )
+        return f'<speak><prosody rate="{self._SPEED}">{sentences}</prosody></speak>'
+
+    @staticmethod
+    def _get_mark_name(story_page_content: StoryPageContent) -> str:
+        return f"page_{story_page_content.page_number}"
@@ -1,15 +1,31 @@
 import os
+import shutil
+from contextlib import closing
 from io import BytesIO
-from typing import Tuple
 
-import openai
 import requests
 from PIL import Image
+from requests.adapters import HTTPAdapter
 
 from data_models import StorySize
 
 
 class ImageGenerator:
+    _DEFAULT_POOL_SIZE: int = 10
+    _DOWNLOAD_CHUNK_SIZE: int = 64 * 1024
+    _DOWNLOAD_TIMEOUT_SECONDS: int = 60
+    _PNG_SIGNATURE: bytes = b"\x89PNG\r\n\x1a\n"
+
+    def __init__(self, pool_size: int = _DEFAULT_POOL_SIZE):
+        # A single session keeps the connections to the image host alive, so
+        # consecutive (or parallel) downloads skip the TCP and TLS handshakes.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_maxsize=max(pool_size, self._DEFAULT_POOL_SIZE),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
     @staticmethod
     def generate_image(prompt: str, story_size: StorySize) -> str:
         """Generate an image for the given prompt/sentence
@@ -20,6 +36,8 @@ class ImageGenerator:
 
         Returns: The url for the generated image
         """
+        import openai
+
         response = openai.Image.create(
             prompt=prompt, n=1, size=story_size.image_part_size
         )
@@ -27,21 +45,73 @@ class ImageGenerator:
         print(f"Generated image for prompt '{prompt}': {url}")
         return url
 
-    @staticmethod
-    def download_image(
-        workdir: str, url: str, image_number: str
-    ) -> Tuple[Image.Image, str]:
+    def download_image(self, workdir: str, url: str, image_number: str) -> str:
         """Download the image from the given url
 
+        PNG images are streamed straight to disk, other formats are converted to PNG.
+        The image is not decoded, consumers read it from the file when they need it.
+
         Args:
             workdir: The workdir where to download the image
             url: The url of the image to download
             image_number: The number of the image in the story sequence
 
-        Returns: A pair of Image object and image file path
+        Returns: The image file path
+        """
+        filepath = self.get_image_filepath(workdir, image_number)
+        with closing(
+            self.session.get(url, stream=True, timeout=self._DOWNLOAD_TIMEOUT_SECONDS)
+        ) as response:
+            response.raise_for_status()
+            chunks = response.iter_content(chunk_size=self._DOWNLOAD_CHUNK_SIZE)
+            head = b""
+            for chunk in chunks:
+                head += chunk
+                if len(head) >= len(self._PNG_SIGNATURE):
+                    break
+
+            if head.startswith(self._PNG_SIGNATURE):
+                with open(filepath, "wb") as file:
+                    file.write(head)
+                    for chunk in chunks:
+                        file.write(chunk)
+            else:
+                content = head + b"".join(chunks)
+                Image.open(BytesIO(content)).save(filepath)
+
+        return filepath
+
+    @staticmethod
+    def get_image_filepath(workdir: str, image_number: str) -> str:
+        """Returns: The file of the given image in the story"""
+        return os.path.join(workdir, f"image_{image_number}.png")
+
+    @staticmethod
+    def copy_image(workdir: str, source_filepath: str, image_number: str) -> str:
+        """Copy an already generated image into the story
+
+        Args:
+            workdir: The workdir where to copy the image
+            source_filepath: The image file to copy
+            image_number: The number of the image in the story sequence
+
+        Returns: The image file path
+        """
+        filepath = ImageGenerator.get_image_filepath(workdir, image_number)
+        shutil.copyfile(source_filepath, filepath)
+        return filepath
+
+    @staticmethod
+    def move_image(workdir: str, source_filepath: str, image_number: str) -> str:
+        """Move an already generated image into the story
+
+        Args:
+            workdir: The workdir where to move the image
+            source_filepath: The image file to move
+            image_number: The number of the image in the story sequence
+
+        Returns: The image file path
         """
-        response = requests.get(url)
-        img = Image.open(BytesIO(response.content))
-        filepath = os.path.join(workdir, f"image_{image_number}.png")
-        img.save(filepath)
-        return img, filepath
+        filepath = ImageGenerator.get_image_filepath(workdir, image_number)
+        os.replace(source_filepath, filepath)
+        return filepath
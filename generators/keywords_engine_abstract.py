@@ -0,0 +1,16 @@
+from abc import ABC, abstractmethod
+from typing import List
+
+
+class AbstractKeywordsEngine(ABC):
+    @abstractmethod
+    def extract_keywords(self, texts: List[str]) -> List[List[str]]:
+        """Extract the most significant keywords of every given text
+
+        Args:
+            texts: The texts to extract keywords from, none of them empty
+
+        Returns: The keywords of every text, most significant first, in the order
+            of the given texts
+        """
+        pass
@@ -0,0 +1,89 @@
+from typing import TYPE_CHECKING, List, Optional
+
+from generators.keywords_engine_abstract import AbstractKeywordsEngine
+from util.embedding_cache import EmbeddingCache
+
+if TYPE_CHECKING:
+    from keybert import KeyBERT
+
+
+class KeywordsEngineKeyBert(AbstractKeywordsEngine):
+    """Keywords whose embeddings are the most similar to the embedding of the text,
+    using a sentence transformer"""
+
+    # The default sentence transformer of KeyBERT.
+    _DEFAULT_MODEL_NAME: str = "all-MiniLM-L6-v2"
+    # The candidates KeyBERT extracts by default, single words without stop words.
+    _STOP_WORDS: str = "english"
+
+    def __init__(
+        self,
+        model: Optional["KeyBERT"] = None,
+        model_name: str = _DEFAULT_MODEL_NAME,
+        embedding_cache: Optional[EmbeddingCache] = None,
+    ):
+        """
+        Args:
+            model: The KeyBERT model, created on first use if not given. Loading it
+                imports torch and a sentence transformer, which takes seconds.
+            model_name: The sentence transformer of the model, identifies its
+                embeddings in the cache
+            embedding_cache: Where to keep the embeddings of documents and candidate
+                keywords, so known texts are not embedded again
+        """
+        self._model = model
+        self.model_name = model_name
+        self.embedding_cache = embedding_cache
+
+    @property
+    def model(self) -> "KeyBERT":
+        if self._model is None:
+            from keybert import KeyBERT
+
+            self._model = KeyBERT(model=self.model_name)
+        return self._model
+
+    def extract_keywords(self, texts: List[str]) -> List[List[str]]:
+        if self.embedding_cache is None:
+            keyword_data = self.model.extract_keywords(
+                texts, stop_words=self._STOP_WORDS
+            )
+        else:
+            keyword_data = self._extract_keyword_data_with_cache(
+                texts, self.embedding_cache
+            )
+        # KeyBERT returns the keywords of a single document unwrapped.
+        if len(texts) == 1:
+            keyword_data = [keyword_data]
+        return [
+            [keyword_entry[0] for keyword_entry in text_keyword_data]
+            for text_keyword_data in keyword_data
+        ]
+
+    def _extract_keyword_data_with_cache(
+        self, texts: List[str], embedding_cache: EmbeddingCache
+    ) -> list:
+        """Returns: What KeyBERT returns for the texts, the (keyword, score) pairs
+        of every text"""
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        # The same candidates KeyBERT extracts, it fits the vectorizer on the same
+        # texts again, so the embeddings match its candidates row by row.
+        vectorizer = CountVectorizer(stop_words=self._STOP_WORDS)
+        try:
+            candidates = list(vectorizer.fit(texts).get_feature_names_out())
+        except ValueError:
+            # There are only stop words in the texts.
+            return [] if len(texts) == 1 else [[] for _ in texts]
+        embed = self.model.model.embed
+        doc_embeddings = embedding_cache.get_embeddings(self.model_name, texts, embed)
+        word_embeddings = embedding_cache.get_embeddings(
+            self.model_name, candidates, embed
+        )
+        print(f"Embedding cache: {embedding_cache.stats()}")
+        return self.model.extract_keywords(
+            texts,
+            vectorizer=vectorizer,
+            doc_embeddings=doc_embeddings,
+            word_embeddings=word_embeddings,
+        )
@@ -0,0 +1,146 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+from generators.keywords_engine_abstract import AbstractKeywordsEngine
+from util.atomic_writer import AtomicWriter
+from util.disk_cache import DiskCache
+
+
+class KeywordsEngineTfidf(AbstractKeywordsEngine):
+    """
+    Keywords that are frequent in the text and rare in a stored corpus of stories:
+     1. Every text is split into lowercase words, without stop words.
+     2. Every word is scored by its count in the text, times its inverse document
+        frequency in the corpus.
+     3. The texts are added to the corpus, which is saved as a JSON file, so the
+        scores get more specific as more stories are seen. Every text is added
+        once, by its hash, so reprocessing a story doesn't change its keywords.
+    No model is loaded, a story takes milliseconds.
+    """
+
+    _DEFAULT_TOP_N: int = 5
+    # The words KeyBERT considers by default, two or more word characters.
+    _WORD_PATTERN = re.compile(r"\b\w\w+\b")
+    _STOP_WORDS = frozenset(
+        """
+        a about above after again against all almost alone along already also
+        although always am among an and another any anyone anything anywhere are
+        around as at back be became because become been before being below
+        beside besides between both but by can cannot could did do does doing done
+        down during each either else enough even ever every everyone everything
+        few for from further get give go had has have having he her here hers
+        herself him himself his how however i if in into is it its itself just
+        last least less many may me might mine more most much must my myself
+        neither never next no nobody none nor not nothing now of off often on once
+        one only onto or other others our ours ourselves out over own per perhaps
+        please put rather re same see seem seemed seems several she should since
+        so some someone something sometime somewhere still such than that the
+        their theirs them themselves then there these they this those though
+        through thus to together too toward towards under until up upon us very
+        via was we well were what whatever when where whether which while who
+        whole whom whose why will with within without would yet you your yours
+        yourself yourselves
+        """.split()
+    )
+
+    def __init__(
+        self,
+        corpus_filepath: Optional[str] = None,
+        update_corpus: bool = True,
+        top_n: int = _DEFAULT_TOP_N,
+    ):
+        """
+        Args:
+            corpus_filepath: The document frequencies of the corpus, a JSON file.
+                Without it every text is scored against the texts of its batch only.
+            update_corpus: Whether to add the texts to the corpus and save it
+            top_n: The maximum number of keywords of a text
+        """
+        self.corpus_filepath = corpus_filepath
+        self.update_corpus = update_corpus
+        self.top_n = top_n
+        self._document_hashes: Set[str] = set()
+        self._document_frequencies: Dict[str, int] = {}
+        self._corpus_loaded = False
+        self._lock = threading.Lock()
+
+    def extract_keywords(self, texts: List[str]) -> List[List[str]]:
+        words_of_texts = [self._get_words(text) for text in texts]
+        with self._lock:
+            self._load_corpus()
+            document_hashes = set(self._document_hashes)
+            document_frequencies = Counter(self._document_frequencies)
+            for text, words in zip(texts, words_of_texts):
+                document_hash = DiskCache.make_key(text)
+                if document_hash not in document_hashes:
+                    document_hashes.add(document_hash)
+                    document_frequencies.update(set(words))
+            num_documents = len(document_hashes)
+            if self.update_corpus and len(document_hashes) > len(self._document_hashes):
+                self._document_hashes = document_hashes
+                self._document_frequencies = dict(document_frequencies)
+                self._save_corpus()
+
+        return [
+            self._get_top_words(words, num_documents, document_frequencies)
+            for words in words_of_texts
+        ]
+
+    def _get_words(self, text: str) -> List[str]:
+        return [
+            word
+            for word in self._WORD_PATTERN.findall(text.lower())
+            if word not in self._STOP_WORDS and not word.isdigit()
+        ]
+
+    def _get_top_words(
+        self, words: List[str], num_documents: int, document_frequencies: Counter
+    ) -> List[str]:
+        first_positions: Dict[str, int] = {}
+        for position, word in enumerate(words):
+            first_positions.setdefault(word, position)
+        scores = {
+            word: count * self._get_idf(num_documents, document_frequencies[word])
+            for word, count in Counter(words).items()
+        }
+        # The highest scores first, ties by the first appearance in the text.
+        ranked_words = sorted(
+            scores, key=lambda word: (-scores[word], first_positions[word])
+        )
+        return ranked_words[: self.top_n]
+
+    @staticmethod
+    def _get_idf(num_documents: int, document_frequency: int) -> float:
+        # Smoothed, so a word that is in every document still counts.
+        return math.log((1 + num_documents) / (1 + document_frequency)) + 1
+
+    def _load_corpus(self) -> None:
+        if self._corpus_loaded:
+            return
+        self._corpus_loaded = True
+        if not self.corpus_filepath or not os.path.isfile(self.corpus_filepath):
+            return
+        with open(self.corpus_filepath) as file:
+            corpus = json.load(file)
+        self._document_hashes = set(corpus["document_hashes"])
+        self._document_frequencies = corpus["document_frequencies"]
+
+    def _save_corpus(self) -> None:
+        if not self.corpus_filepath:
+            return
+        corpus_dir = os.path.dirname(self.corpus_filepath)
+        if corpus_dir:
+            os.makedirs(corpus_dir, exist_ok=True)
+        with AtomicWriter.open(self.corpus_filepath) as file:
+            json.dump(
+                {
+                    "document_hashes": sorted(self._document_hashes),
+                    "document_frequencies": self._document_frequencies,
+                },
+                file,
+            )
@@ -1,17 +1,30 @@
 import os
-from typing import List
-from keybert import KeyBERT
+from itertools import islice
+from typing import Iterable, List, Tuple
 from data_models import StoryContent
+from generators.keywords_engine_abstract import AbstractKeywordsEngine
 
 
 class KeywordsGenerator:
+    ENGINE_KEYBERT: str = "keybert"
+    ENGINE_TFIDF: str = "tfidf"
+    ENGINES: List[str] = [ENGINE_KEYBERT, ENGINE_TFIDF]
+
     _FIXED_KEYWORDS = [
         "story",
         "kids",
     ]
+    # The number of stories passed to the engine together. KeyBERT embeds the
+    # candidates of all the stories of a batch in one pass, so larger batches are
+    # faster but use more memory.
+    _DEFAULT_BATCH_SIZE: int = 64
 
-    def __init__(self, model: KeyBERT):
-        self.model = model
+    def __init__(self, keywords_engine: AbstractKeywordsEngine):
+        """
+        Args:
+            keywords_engine: Extracts the keywords of the stories
+        """
+        self.keywords_engine = keywords_engine
 
     def generate_keywords(self, workdir: str, story_content: StoryContent) -> List[str]:
         """Generate keywords from the given story
@@ -23,13 +36,51 @@ class KeywordsGenerator:
 
         Returns: A list of the most significant keywords in the story
         """
-        keyword_data = self.model.extract_keywords(story_content.raw_text)
-        keywords = self._FIXED_KEYWORDS + [
-            keyword_entry[0] for keyword_entry in keyword_data
-        ]
+        return self.generate_keywords_batch([(workdir, story_content)])[0]
+
+    def generate_keywords_batch(
+        self,
+        stories: Iterable[Tuple[str, StoryContent]],
+        batch_size: int = _DEFAULT_BATCH_SIZE,
+    ) -> List[List[str]]:
+        """Generate keywords for many stories, extracting them in batches
+        Every story gets its own keywords file, as with generate_keywords
 
+        Args:
+            stories: Pairs of (the root workdir of the story, the contents of the story)
+            batch_size: The number of stories to extract keywords from together
+
+        Returns: The keywords of every story, in the order of the given stories
+        """
+        all_keywords: List[List[str]] = []
+        stories_iterator = iter(stories)
+        while True:
+            batch = list(islice(stories_iterator, batch_size))
+            if not batch:
+                break
+            batch_keywords = self._extract_keywords(
+                [story_content.raw_text for _, story_content in batch]
+            )
+            for (workdir, _), keywords in zip(batch, batch_keywords):
+                self._write_keywords(workdir, keywords)
+                all_keywords.append(keywords)
+        return all_keywords
+
+    def _extract_keywords(self, texts: List[str]) -> List[List[str]]:
+        """Returns: The fixed and extracted keywords of every text"""
+        # Empty texts have no keywords, and KeyBERT fails if all of them are.
+        indices = [i for i, text in enumerate(texts) if text.strip()]
+        extracted_keywords: List[List[str]] = [[] for _ in texts]
+        if indices:
+            engine_keywords = self.keywords_engine.extract_keywords(
+                [texts[i] for i in indices]
+            )
+            for i, keywords in zip(indices, engine_keywords):
+                extracted_keywords[i] = keywords
+        return [self._FIXED_KEYWORDS + keywords for keywords in extracted_keywords]
+
+    @staticmethod
+    def _write_keywords(workdir: str, keywords: List[str]) -> None:
         filename = os.path.join(workdir, f"keywords.txt")
         with open(filename, "w") as f:
             f.write(", ".join(keywords))
-
-        return keywords
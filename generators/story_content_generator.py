@@ -1,22 +1,40 @@
-import openai
+import os
+import shutil
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
 
 from data_models import StoryPageContent, StoryContent, StorySize
 from generators.image_generator import ImageGenerator
 from generators.text_generator import TextGenerator
+from util.disk_cache import DiskCache
+from util.dominant_color import DominantColorEngine
 from util.openai_credentials_provider import OpenAICredentialsProvider
 
 
 class StoryContentGenerator:
+    _DEFAULT_IMAGE_CONCURRENCY: int = 1
+    _IMAGE_CACHE_EXT: str = ".png"
+    _STREAMED_IMAGES_DIR: str = "streamed"
+
     def __init__(
         self,
         text_generator: TextGenerator,
         image_generator: ImageGenerator,
         credentials_provider: OpenAICredentialsProvider,
+        image_concurrency: int = _DEFAULT_IMAGE_CONCURRENCY,
+        image_cache: Optional[DiskCache] = None,
+        stream_text: bool = False,
+        dominant_color_engine: Optional[DominantColorEngine] = None,
     ):
-        openai.organization = credentials_provider.organization
-        openai.api_key = credentials_provider.api_key
+        self.credentials_provider = credentials_provider
         self.image_generator = image_generator
         self.text_generator = text_generator
+        self.image_concurrency = max(1, image_concurrency)
+        self.image_cache = image_cache
+        self.stream_text = stream_text
+        self.dominant_color_engine = dominant_color_engine or DominantColorEngine()
 
     def generate_new_story(
         self, workdir_images: str, story_seed_prompt: str, story_size: StorySize
@@ -30,36 +48,146 @@ class StoryContentGenerator:
 
         Returns: The contents of the newly generated story
         """
-        story_text = self.text_generator.generate_story_text(story_seed_prompt)
-        raw_text = story_text.raw_text
-        processed_sentences = story_text.processed_sentences
-        page_contents = []
-
-        for i in range(len(processed_sentences)):
-            image_prompt = (
-                f"A painting for '{processed_sentences[i]}'. "
-                f"{story_seed_prompt}."
-            )
+        # openai is imported on first use, it is slow to import and only needed for
+        # new stories.
+        import openai
+
+        openai.organization = self.credentials_provider.organization
+        openai.api_key = self.credentials_provider.api_key
+
+        # Repeated prompts within the story are generated once, by the first page
+        # that asks for them.
+        image_futures: Dict[str, Future] = {}
+
+        # Each worker generates an image and downloads it right away, so downloads
+        # overlap with the generation requests of other pages.
+        with ThreadPoolExecutor(max_workers=self.image_concurrency) as executor:
+
+            def submit_image(workdir: str, sentence: str, page_index: int) -> None:
+                image_prompt = self._get_image_prompt(sentence, story_seed_prompt)
+                if image_prompt not in image_futures:
+                    image_futures[image_prompt] = executor.submit(
+                        self._generate_image,
+                        workdir_images=workdir,
+                        image_prompt=image_prompt,
+                        story_size=story_size,
+                        image_number=self._get_image_number(page_index),
+                    )
+
+            if self.stream_text:
+                # Images of streamed sentences are generated into a separate dir
+                # and moved into place once the final sentences are known.
+                workdir_streamed = os.path.join(
+                    workdir_images, self._STREAMED_IMAGES_DIR
+                )
+                os.makedirs(workdir_streamed, exist_ok=True)
+                streamed_sentences: List[str] = []
+
+                def on_sentence(sentence: str) -> None:
+                    submit_image(workdir_streamed, sentence, len(streamed_sentences))
+                    streamed_sentences.append(sentence)
+
+                story_text = self.text_generator.generate_story_text(
+                    story_seed_prompt, on_sentence=on_sentence
+                )
+            else:
+                story_text = self.text_generator.generate_story_text(story_seed_prompt)
+
+            # The streamed sentences are expected to match the final sentences, this
+            # only submits the prompts that were not streamed.
+            for i, sentence in enumerate(story_text.processed_sentences):
+                submit_image(workdir_images, sentence, i)
+
+            page_contents = []
+            placed_images: Dict[str, str] = {}
+            for i, sentence in enumerate(story_text.processed_sentences):
+                image_number = self._get_image_number(i)
+                image_prompt = self._get_image_prompt(sentence, story_seed_prompt)
+                # Futures complete in any order, pages are assembled in order.
+                image_path, dominant_color = image_futures[image_prompt].result()
+                if image_prompt in placed_images:
+                    image_path = self.image_generator.copy_image(
+                        workdir=workdir_images,
+                        source_filepath=placed_images[image_prompt],
+                        image_number=image_number,
+                    )
+                elif os.path.dirname(image_path) != workdir_images:
+                    image_path = self.image_generator.move_image(
+                        workdir=workdir_images,
+                        source_filepath=image_path,
+                        image_number=image_number,
+                    )
+                placed_images[image_prompt] = image_path
+                page_contents.append(
+                    StoryPageContent(
+                        sentence=sentence,
+                        # Read from image_path when a page is rendered.
+                        image=None,
+                        image_path=image_path,
+                        page_number=image_number,
+                        dominant_color=dominant_color,
+                    )
+                )
+
+        if self.stream_text:
+            # Only images of streamed sentences that did not make it are left.
+            shutil.rmtree(workdir_streamed)
+
+        if self.image_cache:
+            print(f"Image cache: {self.image_cache.stats()}")
+
+        return StoryContent(
+            story_seed=story_seed_prompt,
+            raw_text=story_text.raw_text,
+            page_contents=page_contents,
+            story_size=story_size,
+        )
+
+    def _generate_image(
+        self,
+        workdir_images: str,
+        image_prompt: str,
+        story_size: StorySize,
+        image_number: str,
+    ) -> Tuple[str, Tuple[int, int, int]]:
+        """Generate the image of a single page, or reuse it from the cache
+
+        Args:
+            workdir_images: The workdir where images should be stored
+            image_prompt: The prompt to generate the image for
+            story_size: Story size configuration
+            image_number: The number of the image in the story sequence
+
+        Returns: A pair of image file path and dominant color of the image. The image
+            is only decoded to find its color, its pixels are not kept.
+        """
+        cache_key = DiskCache.make_key(image_prompt, story_size.image_part_size)
+        image_path = self.image_generator.get_image_filepath(
+            workdir=workdir_images, image_number=image_number
+        )
+        if self.image_cache and self.image_cache.get_copy(
+            cache_key, self._IMAGE_CACHE_EXT, image_path
+        ):
+            print(f"Using cached image for prompt '{image_prompt}'")
+        else:
             url = self.image_generator.generate_image(
                 prompt=image_prompt, story_size=story_size
             )
-            image_number: str = str(i).zfill(3)
-            image, image_path = self.image_generator.download_image(
+            image_path = self.image_generator.download_image(
                 workdir=workdir_images,
                 url=url,
                 image_number=image_number,
             )
-            story_page_content = StoryPageContent(
-                sentence=processed_sentences[i],
-                image=image,
-                image_path=image_path,
-                page_number=image_number,
-            )
-            page_contents.append(story_page_content)
+            if self.image_cache:
+                self.image_cache.put(cache_key, self._IMAGE_CACHE_EXT, image_path)
+        with Image.open(image_path) as image:
+            dominant_color = self.dominant_color_engine.get_dominant_color(image)
+        return image_path, dominant_color
 
-        return StoryContent(
-            story_seed=story_seed_prompt,
-            raw_text=raw_text,
-            page_contents=page_contents,
-            story_size=story_size,
-        )
+    @staticmethod
+    def _get_image_prompt(sentence: str, story_seed_prompt: str) -> str:
+        return f"A painting for '{sentence}'. {story_seed_prompt}."
+
+    @staticmethod
+    def _get_image_number(page_index: int) -> str:
+        return str(page_index).zfill(3)
@@ -1,34 +1,107 @@
-import openai
+from typing import Callable, Iterator, List, Optional
 
 from data_models import StoryText
 from processors.text_processor import TextProcessor
+from util.disk_cache import DiskCache
 
 
 class TextGenerator:
+    _MODEL: str = "text-davinci-003"
     _MAX_TOKENS: int = 1024
+    _TEMPERATURE: float = 0
+    _PROMPT_PREFIX: str = "Give me a story about "
 
-    def __init__(self, text_processor: TextProcessor):
+    def __init__(
+        self,
+        text_processor: TextProcessor,
+        completion_cache: Optional[DiskCache] = None,
+        bypass_cache: bool = False,
+    ):
         self.text_processor = text_processor
+        self.completion_cache = completion_cache
+        self.bypass_cache = bypass_cache
 
-    def generate_story_text(self, prompt: str) -> StoryText:
+    def generate_story_text(
+        self, prompt: str, on_sentence: Optional[Callable[[str], None]] = None
+    ) -> StoryText:
         """Generate story text for the given prompt
 
         Args:
             prompt: The prompt/sentence to generate a story about
+            on_sentence: If given, the completion is streamed and this callback is
+                called with every processed sentence as soon as it is complete
 
         Returns: The AI generated story text
         """
-        story_content = openai.Completion.create(
-            model="text-davinci-003",
-            prompt="Give me a story about " + prompt,
-            max_tokens=self._MAX_TOKENS,
-            temperature=0,
+        completion_prompt = self._PROMPT_PREFIX + prompt
+        cache_key = DiskCache.make_key(
+            self._MODEL,
+            completion_prompt,
+            str(self._MAX_TOKENS),
+            str(self._TEMPERATURE),
         )
-        story_raw_text = story_content["choices"][0]["text"]
+        # Completions are deterministic (temperature is 0), so they can be reused.
+        # Bypassing the cache skips the lookup, but the fresh completion is stored.
+        if self.completion_cache and not self.bypass_cache:
+            cached = self.completion_cache.get_json(cache_key)
+            if cached:
+                print(f"Using cached story text: {cached['raw_text']}")
+                if on_sentence:
+                    for sentence in cached["processed_sentences"]:
+                        on_sentence(sentence)
+                return StoryText(
+                    raw_text=cached["raw_text"],
+                    processed_sentences=cached["processed_sentences"],
+                )
+
+        if on_sentence:
+            text_chunks: List[str] = []
+            for sentence in self.text_processor.iter_processed_sentences(
+                self._stream_completion(completion_prompt, text_chunks)
+            ):
+                on_sentence(sentence)
+            story_raw_text = "".join(text_chunks)
+        else:
+            import openai
+
+            story_content = openai.Completion.create(
+                model=self._MODEL,
+                prompt=completion_prompt,
+                max_tokens=self._MAX_TOKENS,
+                temperature=self._TEMPERATURE,
+            )
+            story_raw_text = story_content["choices"][0]["text"]
+        # The sentences of the whole text are the reference, streamed sentences are
+        # only used to start downstream work early.
         processed_sentences = self.text_processor.process_story_text(
             story_raw_text=story_raw_text
         )
         print(f"Raw story text: {story_raw_text}")
+        if self.completion_cache:
+            self.completion_cache.put_json(
+                cache_key,
+                {
+                    "raw_text": story_raw_text,
+                    "processed_sentences": processed_sentences,
+                },
+            )
         return StoryText(
             raw_text=story_raw_text, processed_sentences=processed_sentences
         )
+
+    def _stream_completion(
+        self, completion_prompt: str, text_chunks: List[str]
+    ) -> Iterator[str]:
+        """Stream the completion, collecting every received chunk in text_chunks"""
+        import openai
+
+        for event in openai.Completion.create(
+            model=self._MODEL,
+            prompt=completion_prompt,
+            max_tokens=self._MAX_TOKENS,
+            temperature=self._TEMPERATURE,
+            stream=True,
+        ):
+            text_chunk = event["choices"][0]["text"]
+            text_chunks.append(text_chunk)
+            yield text_chunk
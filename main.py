@@ -1,40 +1,78 @@
 import argparse
-from typing import Optional
+from typing import List, Optional
 
-from keybert import KeyBERT
-
-from data_models import StorySize
+from data_models import StorySize, VideoRendition
 from generators.audio_generator_abstract import AbstractAudioGenerator
 from generators.audio_generator_gtts import AudioGeneratorGtts
 from generators.audio_generator_polly import AudioGeneratorPolly
 from generators.image_generator import ImageGenerator
+from generators.keywords_engine_abstract import AbstractKeywordsEngine
+from generators.keywords_engine_keybert import KeywordsEngineKeyBert
+from generators.keywords_engine_tfidf import KeywordsEngineTfidf
 from generators.keywords_generator import KeywordsGenerator
 from generators.story_content_generator import StoryContentGenerator
 from generators.text_generator import TextGenerator
+from processors.audio_timeline import AudioTimeline
+from processors.music_library import MusicLibrary
 from processors.page_processor import PageProcessor
+from processors.pdf_image_encoder import PdfImageEncoder
 from processors.pdf_processor import PdfProcessor
 from processors.text_processor import TextProcessor
+from processors.video_encoder import VideoEncoder
 from processors.video_processor import VideoProcessor
 from story_manager import StoryManager
 from story_provider import StoryProvider
 from util.aws_polly_credentials_provider import AwsPollyCredentialsProvider
+from util.disk_cache import DiskCache
+from util.embedding_cache import EmbeddingCache
+from util.image_writer import ImageWriter
+from util.local_polly_client import LocalPollyClient
 from util.openai_credentials_provider import OpenAICredentialsProvider
 from util.story_utility import StoryUtility
 
 
-def create_story_provider(openai_creds_json_filepath: str) -> StoryProvider:
+def create_story_provider(
+    openai_creds_json_filepath: str,
+    image_concurrency: int,
+    image_cache_dir: Optional[str],
+    image_cache_size_mb: int,
+    text_cache_dir: Optional[str],
+    text_cache_size_mb: int,
+    text_cache_max_age_days: float,
+    bypass_text_cache: bool,
+    stream_text: bool,
+) -> StoryProvider:
     """A factory-like method for the story provider."""
     story_utility = StoryUtility()
     text_processor = TextProcessor()
-    text_generator = TextGenerator(text_processor=text_processor)
-    image_generator = ImageGenerator()
+    completion_cache: Optional[DiskCache] = None
+    if text_cache_dir:
+        completion_cache = DiskCache(
+            cache_dir=text_cache_dir,
+            max_size_bytes=text_cache_size_mb * 1024 * 1024,
+            max_age_seconds=text_cache_max_age_days * 24 * 60 * 60,
+        )
+    text_generator = TextGenerator(
+        text_processor=text_processor,
+        completion_cache=completion_cache,
+        bypass_cache=bypass_text_cache,
+    )
+    image_generator = ImageGenerator(pool_size=image_concurrency)
     credentials_provider = OpenAICredentialsProvider(
         json_filepath=openai_creds_json_filepath
     )
+    image_cache: Optional[DiskCache] = None
+    if image_cache_dir:
+        image_cache = DiskCache(
+            cache_dir=image_cache_dir, max_size_bytes=image_cache_size_mb * 1024 * 1024
+        )
     story_content_generator = StoryContentGenerator(
         text_generator=text_generator,
         image_generator=image_generator,
         credentials_provider=credentials_provider,
+        image_concurrency=image_concurrency,
+        image_cache=image_cache,
+        stream_text=stream_text,
     )
     return StoryProvider(
         story_utility=story_utility, story_content_generator=story_content_generator
@@ -42,28 +80,122 @@ def create_story_provider(openai_creds_json_filepath: str) -> StoryProvider:
 
 
 def create_audio_generator(
-    polly_creds_json_filepath: str, use_polly: bool
+    polly_creds_json_filepath: str,
+    use_polly: bool,
+    audio_concurrency: int,
+    audio_cache_dir: Optional[str],
+    audio_cache_size_mb: int,
+    polly_batch: bool,
+    polly_local: bool,
 ) -> AbstractAudioGenerator:
-    if use_polly:
+    audio_cache: Optional[DiskCache] = None
+    if audio_cache_dir:
+        audio_cache = DiskCache(
+            cache_dir=audio_cache_dir, max_size_bytes=audio_cache_size_mb * 1024 * 1024
+        )
+    if use_polly or polly_local:
         return AudioGeneratorPolly(
-            AwsPollyCredentialsProvider(polly_creds_json_filepath)
+            None
+            if polly_local
+            else AwsPollyCredentialsProvider(polly_creds_json_filepath),
+            max_connections=audio_concurrency,
+            audio_cache=audio_cache,
+            batch_synthesis=polly_batch,
+            polly_client=LocalPollyClient() if polly_local else None,
         )
-    return AudioGeneratorGtts()
+    return AudioGeneratorGtts(audio_cache=audio_cache)
+
+
+def create_keywords_generator(
+    keywords_engine: str,
+    keywords_corpus_filepath: Optional[str],
+    embedding_cache_dir: Optional[str],
+    embedding_cache_size_mb: int,
+) -> KeywordsGenerator:
+    """A factory-like method for the keywords generator."""
+    engine: AbstractKeywordsEngine
+    if keywords_engine == KeywordsGenerator.ENGINE_TFIDF:
+        engine = KeywordsEngineTfidf(corpus_filepath=keywords_corpus_filepath)
+    else:
+        # The KeyBERT model is loaded when the first keywords are generated.
+        engine = KeywordsEngineKeyBert(
+            embedding_cache=EmbeddingCache(
+                cache_dir=embedding_cache_dir,
+                max_size_bytes=embedding_cache_size_mb * 1024 * 1024,
+            )
+            if embedding_cache_dir
+            else None
+        )
+    return KeywordsGenerator(keywords_engine=engine)
 
 
 def create_story_manager(
-    polly_creds_json_filepath: str, use_polly: bool
+    polly_creds_json_filepath: str,
+    use_polly: bool,
+    audio_concurrency: int,
+    audio_cache_dir: Optional[str],
+    audio_cache_size_mb: int,
+    polly_batch: bool,
+    polly_local: bool,
+    render_workers: int,
+    page_png_mode: str,
+    stream_window: Optional[int],
+    video_mode: str,
+    video_workers: Optional[int],
+    video_renditions: List[VideoRendition],
+    music_cache_dir: Optional[str],
+    music_cache_size_mb: int,
+    pdf_image_format: Optional[str],
+    pdf_jpeg_quality: int,
+    pdf_dpi: int,
+    pdf_workers: Optional[int],
+    keywords_engine: str,
+    keywords_corpus_filepath: Optional[str],
+    embedding_cache_dir: Optional[str],
+    embedding_cache_size_mb: int,
 ) -> StoryManager:
     """A factory-like method for the story manager."""
     audio_generator = create_audio_generator(
-        polly_creds_json_filepath=polly_creds_json_filepath, use_polly=use_polly
+        polly_creds_json_filepath=polly_creds_json_filepath,
+        use_polly=use_polly,
+        audio_concurrency=audio_concurrency,
+        audio_cache_dir=audio_cache_dir,
+        audio_cache_size_mb=audio_cache_size_mb,
+        polly_batch=polly_batch,
+        polly_local=polly_local,
     )
 
-    keybert_model = KeyBERT()
-    keywords_generator = KeywordsGenerator(model=keybert_model)
-    page_processor = PageProcessor()
-    pdf_processor = PdfProcessor()
-    video_processor = VideoProcessor()
+    music_library: Optional[MusicLibrary] = None
+    if music_cache_dir:
+        music_library = MusicLibrary(
+            music_cache=DiskCache(
+                cache_dir=music_cache_dir,
+                max_size_bytes=music_cache_size_mb * 1024 * 1024,
+            )
+        )
+
+    keywords_generator = create_keywords_generator(
+        keywords_engine=keywords_engine,
+        keywords_corpus_filepath=keywords_corpus_filepath,
+        embedding_cache_dir=embedding_cache_dir,
+        embedding_cache_size_mb=embedding_cache_size_mb,
+    )
+    page_processor = PageProcessor(image_writer=ImageWriter(mode=page_png_mode))
+    pdf_image_encoder: Optional[PdfImageEncoder] = None
+    if pdf_image_format:
+        pdf_image_encoder = PdfImageEncoder(
+            image_format=pdf_image_format,
+            jpeg_quality=pdf_jpeg_quality,
+            dpi=pdf_dpi,
+            max_workers=pdf_workers,
+        )
+    pdf_processor = PdfProcessor(image_encoder=pdf_image_encoder)
+    video_processor = VideoProcessor(
+        audio_timeline=AudioTimeline(music_library=music_library),
+        video_encoder=VideoEncoder(max_workers=video_workers),
+        mode=video_mode,
+        renditions=video_renditions,
+    )
 
     return StoryManager(
         audio_generator=audio_generator,
@@ -71,6 +203,9 @@ def create_story_manager(
         page_processor=page_processor,
         pdf_processor=pdf_processor,
         video_processor=video_processor,
+        audio_concurrency=audio_concurrency,
+        render_workers=render_workers,
+        stream_window=stream_window,
     )
 
 
@@ -81,12 +216,71 @@ def enact(
     polly_creds_json_filepath: str,
     story_size: StorySize,
     use_polly: bool,
+    image_concurrency: int,
+    image_cache_dir: Optional[str],
+    image_cache_size_mb: int,
+    text_cache_dir: Optional[str],
+    text_cache_size_mb: int,
+    text_cache_max_age_days: float,
+    bypass_text_cache: bool,
+    stream_text: bool,
+    audio_concurrency: int,
+    audio_cache_dir: Optional[str],
+    audio_cache_size_mb: int,
+    polly_batch: bool,
+    polly_local: bool,
+    render_workers: int,
+    page_png_mode: str,
+    stream_window: Optional[int],
+    video_mode: str,
+    video_workers: Optional[int],
+    video_renditions: List[VideoRendition],
+    music_cache_dir: Optional[str],
+    music_cache_size_mb: int,
+    pdf_image_format: Optional[str],
+    pdf_jpeg_quality: int,
+    pdf_dpi: int,
+    pdf_workers: Optional[int],
+    keywords_engine: str,
+    keywords_corpus_filepath: Optional[str],
+    embedding_cache_dir: Optional[str],
+    embedding_cache_size_mb: int,
 ):
     story_provider: StoryProvider = create_story_provider(
-        openai_creds_json_filepath=openai_creds_json_filepath
+        openai_creds_json_filepath=openai_creds_json_filepath,
+        image_concurrency=image_concurrency,
+        image_cache_dir=image_cache_dir,
+        image_cache_size_mb=image_cache_size_mb,
+        text_cache_dir=text_cache_dir,
+        text_cache_size_mb=text_cache_size_mb,
+        text_cache_max_age_days=text_cache_max_age_days,
+        bypass_text_cache=bypass_text_cache,
+        stream_text=stream_text,
     )
     story_manager: StoryManager = create_story_manager(
-        polly_creds_json_filepath=polly_creds_json_filepath, use_polly=use_polly
+        polly_creds_json_filepath=polly_creds_json_filepath,
+        use_polly=use_polly,
+        audio_concurrency=audio_concurrency,
+        audio_cache_dir=audio_cache_dir,
+        audio_cache_size_mb=audio_cache_size_mb,
+        polly_batch=polly_batch,
+        polly_local=polly_local,
+        render_workers=render_workers,
+        page_png_mode=page_png_mode,
+        stream_window=stream_window,
+        video_mode=video_mode,
+        video_workers=video_workers,
+        video_renditions=video_renditions,
+        music_cache_dir=music_cache_dir,
+        music_cache_size_mb=music_cache_size_mb,
+        pdf_image_format=pdf_image_format,
+        pdf_jpeg_quality=pdf_jpeg_quality,
+        pdf_dpi=pdf_dpi,
+        pdf_workers=pdf_workers,
+        keywords_engine=keywords_engine,
+        keywords_corpus_filepath=keywords_corpus_filepath,
+        embedding_cache_dir=embedding_cache_dir,
+        embedding_cache_size_mb=embedding_cache_size_mb,
     )
     combined_workdir, story_content = story_provider.generate_or_load(
         story_prompt=story_prompt, pickle_file=pickle_file, story_size=story_size
@@ -103,9 +297,9 @@ if __name__ == "__main__":
     )
     group.add_argument(
         "--pickle",
-        help="A pickle file to load an existing story. "
+        help="The manifest or the pickle file of an existing story. "
         "For example: ./_stories/2023_01_06_17_38_47"
-        "-Five_Little_Monkeys/story_content.pickle",
+        "-Five_Little_Monkeys/story_manifest.json",
     )
 
     parser.add_argument(
@@ -133,7 +327,244 @@ if __name__ == "__main__":
         help="Use AWS Polly for text to speech.",
     )
 
+    parser.add_argument(
+        "--image-concurrency",
+        type=int,
+        default=1,
+        help="Number of page images to generate and download in parallel.",
+    )
+
+    parser.add_argument(
+        "--image-cache-dir",
+        help="Directory of the generated images cache, shared across runs.",
+        default="_cache/images",
+    )
+    parser.add_argument(
+        "--image-cache-size-mb",
+        type=int,
+        default=1024,
+        help="Maximum size of the generated images cache in MB.",
+    )
+    parser.add_argument(
+        "--no-image-cache",
+        default=False,
+        action="store_true",
+        help="Always call the image generation API, without using the image cache.",
+    )
+
+    parser.add_argument(
+        "--text-cache-dir",
+        help="Directory of the story text cache, shared across runs.",
+        default="_cache/text",
+    )
+    parser.add_argument(
+        "--text-cache-size-mb",
+        type=int,
+        default=64,
+        help="Maximum size of the story text cache in MB.",
+    )
+    parser.add_argument(
+        "--text-cache-max-age-days",
+        type=float,
+        default=30,
+        help="Cached story texts older than this are generated again.",
+    )
+    parser.add_argument(
+        "--bypass-text-cache",
+        default=False,
+        action="store_true",
+        help="Always call the text generation API, the result is still cached.",
+    )
+    parser.add_argument(
+        "--no-text-cache",
+        default=False,
+        action="store_true",
+        help="Always call the text generation API, without using the text cache.",
+    )
+
+    parser.add_argument(
+        "--stream-text",
+        default=False,
+        action="store_true",
+        help="Stream the story text and start generating images sentence by sentence.",
+    )
+
+    parser.add_argument(
+        "--audio-concurrency",
+        type=int,
+        default=1,
+        help="Number of pages to convert to speech in parallel.",
+    )
+
+    parser.add_argument(
+        "--audio-cache-dir",
+        help="Directory of the text to speech cache, shared across runs.",
+        default="_cache/audio",
+    )
+    parser.add_argument(
+        "--audio-cache-size-mb",
+        type=int,
+        default=512,
+        help="Maximum size of the text to speech cache in MB.",
+    )
+    parser.add_argument(
+        "--no-audio-cache",
+        default=False,
+        action="store_true",
+        help="Always convert text to speech, without using the audio cache.",
+    )
+
+    parser.add_argument(
+        "--polly-batch",
+        default=False,
+        action="store_true",
+        help="Send the whole story to AWS Polly in as few requests as possible.",
+    )
+    parser.add_argument(
+        "--polly-local",
+        default=False,
+        action="store_true",
+        help="Use an offline stand-in for AWS Polly that produces tones instead of "
+        "speech, no credentials needed.",
+    )
+
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        default=1,
+        help="Number of processes rendering pages while the audio is generated.",
+    )
+
+    parser.add_argument(
+        "--page-png",
+        choices=ImageWriter.MODES,
+        default=ImageWriter.MODE_BACKGROUND,
+        help="How to save the rendered pages as PNG files. The video and PDF are made "
+        "from the pages in memory, so the files can be saved in the background or not "
+        "at all.",
+    )
+    parser.add_argument(
+        "--stream-pages",
+        type=int,
+        default=None,
+        help="Keep at most this many rendered pages in memory, the PDF and video read "
+        "the older pages back from their PNG files. Bounds the memory of long "
+        "stories, can't be used with --page-png off. With --render-workers, every "
+        "page is released as soon as it is rendered, whatever the value. By default "
+        "all the pages are kept in memory.",
+    )
+
+    parser.add_argument(
+        "--video-mode",
+        choices=VideoProcessor.MODES,
+        default=VideoProcessor.MODE_COMPOSE,
+        help="compose: encode every frame at a fixed frame rate with moviepy. "
+        "slideshow: send every page to ffmpeg once, with its duration. "
+        "segments: encode every page to its own segment in parallel and join them.",
+    )
+    parser.add_argument(
+        "--video-workers",
+        type=int,
+        default=None,
+        help="Number of video segments to encode in parallel, defaults to the "
+        "number of CPUs.",
+    )
+
+    parser.add_argument(
+        "--rendition",
+        action="append",
+        default=[],
+        help="A video to create, can be repeated to create several videos from the "
+        "same pages and audio. For example: 720p:height=720,preset=fast,crf=20 "
+        "Settings are height, preset, crf, bitrate (e.g. 2M) and threads. A "
+        'rendition named "default" is written to final_video.mp4, the others to '
+        "final_video_<name>.mp4. Defaults to a single video at the page size. In "
+        "the compose video mode, only the first rendition is composited, the "
+        "others are encoded as slideshows of the same pages and audio.",
+    )
+
+    parser.add_argument(
+        "--music-cache-dir",
+        help="Directory of the decoded background music cache, shared across runs.",
+        default="_cache/music",
+    )
+    parser.add_argument(
+        "--music-cache-size-mb",
+        type=int,
+        default=1024,
+        help="Maximum size of the decoded background music cache in MB.",
+    )
+    parser.add_argument(
+        "--no-music-cache",
+        default=False,
+        action="store_true",
+        help="Decode the background music for every video, without using the cache.",
+    )
+
+    parser.add_argument(
+        "--pdf-images",
+        choices=PdfImageEncoder.FORMATS,
+        default=None,
+        help="Encode the PDF page images in parallel, as jpeg or png, fitted to the "
+        "page and deduplicated. By default the page files are embedded as they are.",
+    )
+    parser.add_argument(
+        "--pdf-jpeg-quality",
+        type=int,
+        default=85,
+        help="The JPEG quality of the PDF page images, 1 to 95.",
+    )
+    parser.add_argument(
+        "--pdf-dpi",
+        type=int,
+        default=150,
+        help="The maximum resolution of the encoded PDF page images.",
+    )
+    parser.add_argument(
+        "--pdf-workers",
+        type=int,
+        default=None,
+        help="Number of PDF page images to encode in parallel, defaults to the "
+        "number of CPUs.",
+    )
+
+    parser.add_argument(
+        "--keywords-engine",
+        choices=KeywordsGenerator.ENGINES,
+        default=KeywordsGenerator.ENGINE_KEYBERT,
+        help="How to extract the story keywords. keybert - Semantic, loads a "
+        "sentence transformer model. tfidf - Statistical, scored against the "
+        "stories seen before, takes milliseconds.",
+    )
+    parser.add_argument(
+        "--keywords-corpus",
+        help="The document frequencies of the stories seen before, used and "
+        "updated by the tfidf keywords engine.",
+        default="_cache/keywords_corpus.json",
+    )
+    parser.add_argument(
+        "--embedding-cache-dir",
+        help="Directory of the keyword embeddings cache, shared across runs.",
+        default="_cache/embeddings",
+    )
+    parser.add_argument(
+        "--embedding-cache-size-mb",
+        type=int,
+        default=256,
+        help="Maximum size of the keyword embeddings cache of a model in MB, it is "
+        "rebuilt with the latest embeddings only once it is full.",
+    )
+    parser.add_argument(
+        "--no-embedding-cache",
+        default=False,
+        action="store_true",
+        help="Embed the story and its candidate keywords every time, without "
+        "using the cache.",
+    )
+
     args = parser.parse_args()
+    if args.stream_pages is not None and args.stream_pages < 1:
+        parser.error("--stream-pages must be at least 1")
 
     enact(
         story_prompt=args.prompt,
@@ -142,4 +573,38 @@ if __name__ == "__main__":
         polly_creds_json_filepath=args.polly_creds,
         story_size=StorySize.get_size_from_str(args.size),
         use_polly=args.polly,
+        image_concurrency=args.image_concurrency,
+        image_cache_dir=None if args.no_image_cache else args.image_cache_dir,
+        image_cache_size_mb=args.image_cache_size_mb,
+        text_cache_dir=None if args.no_text_cache else args.text_cache_dir,
+        text_cache_size_mb=args.text_cache_size_mb,
+        text_cache_max_age_days=args.text_cache_max_age_days,
+        bypass_text_cache=args.bypass_text_cache,
+        stream_text=args.stream_text,
+        audio_concurrency=args.audio_concurrency,
+        audio_cache_dir=None if args.no_audio_cache else args.audio_cache_dir,
+        audio_cache_size_mb=args.audio_cache_size_mb,
+        polly_batch=args.polly_batch,
+        polly_local=args.polly_local,
+        render_workers=args.render_workers,
+        page_png_mode=args.page_png,
+        stream_window=args.stream_pages,
+        video_mode=args.video_mode,
+        video_workers=args.video_workers,
+        video_renditions=[
+            VideoRendition.get_rendition_from_str(rendition)
+            for rendition in args.rendition
+        ],
+        music_cache_dir=None if args.no_music_cache else args.music_cache_dir,
+        music_cache_size_mb=args.music_cache_size_mb,
+        pdf_image_format=args.pdf_images,
+        pdf_jpeg_quality=args.pdf_jpeg_quality,
+        pdf_dpi=args.pdf_dpi,
+        pdf_workers=args.pdf_workers,
+        keywords_engine=args.keywords_engine,
+        keywords_corpus_filepath=args.keywords_corpus,
+        embedding_cache_dir=None
+        if args.no_embedding_cache
+        else args.embedding_cache_dir,
+        embedding_cache_size_mb=args.embedding_cache_size_mb,
     )
@@ -0,0 +1,124 @@
+import subprocess
+import wave
+from typing import List, Optional, Tuple
+
+import numpy
+
+from processors.music_library import MusicLibrary
+
+
+class AudioTimeline:
+    """
+    Assemble the audio track of a story in a single pass:
+     1. Decode every page audio once, with one short lived ffmpeg process per file.
+     2. Lay the pages out at their start times in one preallocated sample buffer.
+     3. Mix in the looped and attenuated background music, served by the music
+        library when there is one.
+    """
+
+    _DEFAULT_SAMPLE_RATE: int = 44100
+    _CHANNELS: int = 2
+    _WAV_SAMPLE_WIDTH: int = 2
+    _INT16_MAX: int = 32767
+
+    def __init__(
+        self,
+        sample_rate: int = _DEFAULT_SAMPLE_RATE,
+        music_library: Optional[MusicLibrary] = None,
+    ):
+        self.sample_rate = sample_rate
+        self.music_library = music_library
+
+    def assemble(
+        self,
+        page_audios: List[Tuple[str, float]],
+        duration_in_seconds: float,
+        background_music_filepath: Optional[str] = None,
+        background_music_volume: float = 1.0,
+    ) -> numpy.ndarray:
+        """Assemble the full audio track
+
+        Args:
+            page_audios: Pairs of (audio filepath, start time in seconds)
+            duration_in_seconds: The length of the track
+            background_music_filepath: Optional music looped under the whole track
+            background_music_volume: The volume factor of the background music
+
+        Returns: A float32 array of shape (samples, channels)
+        """
+        track = numpy.zeros(
+            (self._to_sample_index(duration_in_seconds), self._CHANNELS),
+            dtype=numpy.float32,
+        )
+
+        for filepath, start_in_seconds in page_audios:
+            samples = self.decode(filepath)
+            start = self._to_sample_index(start_in_seconds)
+            end = min(start + len(samples), len(track))
+            track[start:end] += samples[: end - start]
+
+        if background_music_filepath and self.music_library:
+            track += self.music_library.get_segment(
+                background_music_filepath,
+                num_samples=len(track),
+                sample_rate=self.sample_rate,
+                channels=self._CHANNELS,
+                volume=background_music_volume,
+            )
+        elif background_music_filepath:
+            music = self.decode(background_music_filepath)
+            if len(music):
+                # numpy.resize repeats the music until it fills the whole track.
+                looped = numpy.resize(music, track.shape)
+                track += looped * numpy.float32(background_music_volume)
+
+        numpy.clip(track, -1.0, 1.0, out=track)
+        return track
+
+    def decode(self, filepath: str) -> numpy.ndarray:
+        """Decode the given audio file to float32 samples at the timeline sample rate
+
+        Args:
+            filepath: Any audio file ffmpeg can read
+
+        Returns: A float32 array of shape (samples, channels)
+        """
+        from moviepy.config import get_setting
+
+        command = [
+            get_setting("FFMPEG_BINARY"),
+            "-v",
+            "error",
+            "-i",
+            filepath,
+            "-f",
+            "f32le",
+            "-acodec",
+            "pcm_f32le",
+            "-ac",
+            str(self._CHANNELS),
+            "-ar",
+            str(self.sample_rate),
+            "-",
+        ]
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"Could not decode audio file {filepath}: {result.stderr.decode()}"
+            )
+        return numpy.frombuffer(result.stdout, dtype=numpy.float32).reshape(
+            -1, self._CHANNELS
+        )
+
+    def write_wav(self, track: numpy.ndarray, filepath: str) -> str:
+        """Write the given track as a 16 bit PCM wav file"""
+        pcm = (track * self._INT16_MAX).astype("<i2")
+        with wave.open(filepath, "wb") as wav_file:
+            wav_file.setnchannels(self._CHANNELS)
+            wav_file.setsampwidth(self._WAV_SAMPLE_WIDTH)
+            wav_file.setframerate(self.sample_rate)
+            wav_file.writeframes(pcm.tobytes())
+        return filepath
+
+    def _to_sample_index(self, seconds: float) -> int:
+        return int(round(seconds * self.sample_rate))
@@ -0,0 +1,145 @@
+import os
+import subprocess
+import threading
+from typing import Dict
+
+import numpy
+
+from util.disk_cache import DiskCache
+
+
+class MusicLibrary:
+    """
+    Background music, decoded once per track and served from memory mapped PCM:
+     1. Every track is decoded to raw float32 samples at the target sample rate and
+        stored in a disk cache. The key includes the size and modification time of
+        the track, so a changed track is decoded again. A track evicted before it
+        is mapped is decoded in memory instead.
+     2. The decoded tracks are memory mapped, so only the samples that are used are
+        read, and the pages are shared between renders and processes.
+     3. Segments of any length are served looped and attenuated.
+    """
+
+    _PCM_EXT: str = ".f32"
+    _BACKEND: str = "pcm_f32le"
+
+    def __init__(self, music_cache: DiskCache):
+        self.music_cache = music_cache
+        self._tracks: Dict[str, numpy.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def get_segment(
+        self,
+        filepath: str,
+        num_samples: int,
+        sample_rate: int,
+        channels: int,
+        volume: float = 1.0,
+    ) -> numpy.ndarray:
+        """Get the given track, looped to the given length and attenuated
+
+        Args:
+            filepath: The music track, any audio file ffmpeg can read
+            num_samples: The length of the segment in samples
+            sample_rate: The sample rate of the segment
+            channels: The number of channels of the segment
+            volume: The volume factor of the segment
+
+        Returns: A float32 array of shape (num_samples, channels)
+        """
+        track = self._get_track(filepath, sample_rate=sample_rate, channels=channels)
+        segment = numpy.zeros((num_samples, channels), dtype=numpy.float32)
+        if not len(track):
+            return segment
+        volume_factor = numpy.float32(volume)
+        for start in range(0, num_samples, len(track)):
+            end = min(start + len(track), num_samples)
+            numpy.multiply(track[: end - start], volume_factor, out=segment[start:end])
+        return segment
+
+    def _get_track(
+        self, filepath: str, sample_rate: int, channels: int
+    ) -> numpy.ndarray:
+        key = self._get_cache_key(filepath, sample_rate=sample_rate, channels=channels)
+        with self._lock:
+            if key in self._tracks:
+                return self._tracks[key]
+
+        pcm_filepath = self.music_cache.get(key, self._PCM_EXT)
+        if not pcm_filepath:
+            print(f"Decoding background music: {filepath}")
+
+            def decode(output: str) -> None:
+                self._decode(filepath, sample_rate, channels, output)
+
+            # Decoded straight into the cache, the PCM is tens of MB.
+            pcm_filepath = self.music_cache.put_written(key, self._PCM_EXT, decode)
+        try:
+            track = self._map_track(pcm_filepath, channels=channels)
+        except FileNotFoundError:
+            # Evicted by a concurrent put, decode it in memory instead.
+            print(f"Decoding background music in memory: {filepath}")
+            track = numpy.frombuffer(
+                self._decode(filepath, sample_rate, channels, "-"), dtype=numpy.float32
+            ).reshape(-1, channels)
+        with self._lock:
+            self._tracks[key] = track
+        return track
+
+    @staticmethod
+    def _map_track(pcm_filepath: str, channels: int) -> numpy.ndarray:
+        if os.path.getsize(pcm_filepath) == 0:
+            # numpy can't map an empty file.
+            return numpy.zeros((0, channels), dtype=numpy.float32)
+        return numpy.memmap(pcm_filepath, dtype=numpy.float32, mode="r").reshape(
+            -1, channels
+        )
+
+    def _decode(
+        self, filepath: str, sample_rate: int, channels: int, output: str
+    ) -> bytes:
+        """Decode the track to raw float32 samples
+
+        Args:
+            filepath: The music track
+            sample_rate: The sample rate of the samples
+            channels: The number of channels of the samples
+            output: The file to write the samples to, or "-" to return them
+
+        Returns: The samples when the output is "-", empty bytes otherwise
+        """
+        from moviepy.config import get_setting
+
+        command = [
+            get_setting("FFMPEG_BINARY"),
+            "-v",
+            "error",
+            "-i",
+            filepath,
+            "-f",
+            "f32le",
+            "-acodec",
+            self._BACKEND,
+            "-ac",
+            str(channels),
+            "-ar",
+            str(sample_rate),
+            output,
+        ]
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"Could not decode music file {filepath}: {result.stderr.decode()}"
+            )
+        return result.stdout
+
+    def _get_cache_key(self, filepath: str, sample_rate: int, channels: int) -> str:
+        stat = os.stat(filepath)
+        return DiskCache.make_key(
+            self._BACKEND,
+            os.path.abspath(filepath),
+            str(stat.st_size),
+            str(stat.st_mtime_ns),
+            str(sample_rate),
+            str(channels),
+        )
@@ -1,14 +1,15 @@
 import os
-from typing import Tuple
+from typing import Optional, Tuple
 
-import numpy
-from fast_colorthief import get_dominant_color
 from PIL import ImageFont, Image, ImageDraw
 from data_models import StoryPageContent, StoryPage, AudioInfo, StorySize
 
 from justifytext import justify
 
+from processors.render_asset_cache import RenderAssetCache
+from util.dominant_color import DominantColorEngine
 from util.gradient_image import GradientImage
+from util.image_writer import ImageWriter
 
 
 class PageProcessor:
@@ -20,6 +21,27 @@ class PageProcessor:
     _TEXT_JUSTIFICATION_WIDTH: int = 20
     _PAPER_BLEND_FACTOR: float = 0.1
     _PAPER_IMAGE_PATH: str = "./images/paper.jpeg"
+    _END_PAGE_MESSAGE: str = "The End"
+
+    def __init__(
+        self,
+        asset_cache: Optional[RenderAssetCache] = None,
+        dominant_color_engine: Optional[DominantColorEngine] = None,
+        image_writer: Optional[ImageWriter] = None,
+    ):
+        self.asset_cache = asset_cache or RenderAssetCache.get_shared(
+            font_filepath=self._FONT, paper_image_filepath=self._PAPER_IMAGE_PATH
+        )
+        self.dominant_color_engine = dominant_color_engine or DominantColorEngine()
+        self.image_writer = image_writer or ImageWriter()
+
+    def warm_up(self, story_size: StorySize) -> None:
+        """Load the assets needed to render pages of the given size"""
+        self.asset_cache.warm_up(story_size, title_font_size=self._FONT_TITLES_SIZE)
+
+    def flush(self) -> None:
+        """Wait until all the rendered pages are saved"""
+        self.image_writer.flush()
 
     def create_page(
         self,
@@ -28,76 +50,104 @@ class PageProcessor:
         audio: AudioInfo,
         story_size: StorySize,
     ) -> StoryPage:
+        page_image, page_filepath = self.render_page(
+            workdir=workdir,
+            story_page_content=story_page_content,
+            story_size=story_size,
+        )
+        return StoryPage(
+            page_content=story_page_content,
+            page_image=page_image,
+            page_filepath=page_filepath,
+            audio=audio,
+        )
 
+    def render_page(
+        self, workdir: str, story_page_content: StoryPageContent, story_size: StorySize
+    ) -> Tuple[Image.Image, str]:
+        """Render a story page and hand it to the image writer to be saved as a PNG
+        file. Only depends on the page content, so pages can be rendered in any order
+        and in other processes.
+
+        Args:
+            workdir: The workdir where to save the page
+            story_page_content: The content of the page
+            story_size: The size of the story
+
+        Returns: The page image and its filepath, the file might not be written yet
+        """
         background_color = self._calculate_background_color(story_page_content)
 
         text_img: Image.Image = self._create_text_image(
             size=(story_size.text_part_width, story_size.text_part_height),
             bg_color=background_color,
             message=story_page_content.sentence,
-            font=ImageFont.truetype(self._FONT, story_size.font_size),
+            font=self.asset_cache.get_font(story_size.font_size),
             font_color=self._BLACK_COLOR,
         )
 
         if int(story_page_content.page_number) % 2 == 0:
             page_image: Image.Image = self._concat_horizontally(
-                story_page_content.image, text_img
+                story_page_content.get_image(), text_img
             )
         else:
-            page_image = self._concat_horizontally(text_img, story_page_content.image)
+            page_image = self._concat_horizontally(
+                text_img, story_page_content.get_image()
+            )
 
         page_image = self._add_paper_effect(page_image)
         page_filepath = os.path.join(
             workdir, f"page_{story_page_content.page_number}.png"
         )
-        page_image.save(page_filepath)
-        return StoryPage(
-            page_content=story_page_content,
-            page_image=page_image,
-            page_filepath=page_filepath,
-            audio=audio,
-        )
+        self.image_writer.write(page_image, page_filepath)
+        return page_image, page_filepath
 
     def create_start_page(
         self, workdir: str, prompt: str, story_size: StorySize
     ) -> str:
-        text_img = self._create_text_image(
-            size=(story_size.page_width, story_size.page_height),
-            bg_color=self._BLACK_COLOR,
-            message=prompt,
-            font=ImageFont.truetype(self._FONT, self._FONT_TITLES_SIZE),
-            font_color=self._WHITE_COLOR,
-            should_justify_text=False,
-        )
-
         page_filepath = os.path.join(workdir, f"page_start.png")
-        text_img.save(page_filepath)
+        self._write_static_page(page_filepath, message=prompt, story_size=story_size)
         return page_filepath
 
     def create_end_page(self, workdir: str, story_size: StorySize) -> str:
-        text_img = self._create_text_image(
-            size=(story_size.page_width, story_size.page_height),
-            bg_color=self._BLACK_COLOR,
-            message="The End",
-            font=ImageFont.truetype(self._FONT, self._FONT_TITLES_SIZE),
-            font_color=self._WHITE_COLOR,
-            should_justify_text=False,
-        )
-
         page_filepath = os.path.join(workdir, f"page_end.png")
-        text_img.save(page_filepath)
+        self._write_static_page(
+            page_filepath, message=self._END_PAGE_MESSAGE, story_size=story_size
+        )
         return page_filepath
 
+    def _write_static_page(
+        self, page_filepath: str, message: str, story_size: StorySize
+    ) -> None:
+        """Write a title page, rendered once per message and size."""
+
+        def render() -> Image.Image:
+            return self._create_text_image(
+                size=(story_size.page_width, story_size.page_height),
+                bg_color=self._BLACK_COLOR,
+                message=message,
+                font=self.asset_cache.get_font(self._FONT_TITLES_SIZE),
+                font_color=self._WHITE_COLOR,
+                should_justify_text=False,
+            )
+
+        png_data = self.asset_cache.get_static_page((message, story_size), render)
+        with open(page_filepath, "wb") as file:
+            file.write(png_data)
+
     def _add_paper_effect(self, page_image: Image) -> Image:
-        paper: Image = Image.open(self._PAPER_IMAGE_PATH).convert(page_image.mode)
-        paper = paper.resize(page_image.size)
+        paper = self.asset_cache.get_paper(page_image.size, page_image.mode)
         return Image.blend(page_image, paper, self._PAPER_BLEND_FACTOR)
 
     def _calculate_background_color(self, story_page_content: StoryPageContent):
-        rgba_image = story_page_content.image.convert("RGBA")
-        ndarray = numpy.array(rgba_image).astype(numpy.uint8)
-        dominant_color = get_dominant_color(ndarray, quality=1)
-        return self._lighten_color(dominant_color)
+        if story_page_content.dominant_color is None:
+            # Stories generated before the dominant color was stored with the page.
+            story_page_content.dominant_color = (
+                self.dominant_color_engine.get_dominant_color(
+                    story_page_content.get_image()
+                )
+            )
+        return self._lighten_color(story_page_content.dominant_color)
 
     def _lighten_color(self, color: Tuple[int, int, int]) -> Tuple[int, int, int]:
         return (
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import struct
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+
+class PdfImageEncoder:
+    """
+    Encode page images for the PDF ahead of FPDF:
+     1. Every image is resampled down to the target DPI at the size it is placed at.
+     2. Images are encoded in parallel, as JPEG (embedded as is, with DCTDecode) or
+        PNG (its compressed data is embedded as is, with FlateDecode).
+     3. Identical images are encoded and embedded once.
+     4. Only a bounded number of images is being encoded or waiting to be consumed,
+        so the source pages can be read one at a time.
+    The result is the image info FPDF builds when it parses an image file. FPDF keeps
+    every embedded image in memory until the PDF is written, so that holds all the
+    encoded images, though not their decoded pixels.
+    """
+
+    FORMAT_JPEG: str = "jpeg"
+    FORMAT_PNG: str = "png"
+    FORMATS: List[str] = [FORMAT_JPEG, FORMAT_PNG]
+
+    _DEFAULT_JPEG_QUALITY: int = 85
+    _DEFAULT_DPI: int = 150
+    _MM_PER_INCH: float = 25.4
+    # The number of images being encoded or waiting to be consumed, per worker.
+    _IMAGES_IN_FLIGHT_PER_WORKER: int = 2
+    _PNG_SIGNATURE: bytes = b"\x89PNG\r\n\x1a\n"
+
+    def __init__(
+        self,
+        image_format: str = FORMAT_JPEG,
+        jpeg_quality: int = _DEFAULT_JPEG_QUALITY,
+        dpi: int = _DEFAULT_DPI,
+        max_workers: Optional[int] = None,
+    ):
+        """
+        Args:
+            image_format: jpeg - Smaller files, lossy. png - Lossless.
+            jpeg_quality: The JPEG quality, 1 to 95
+            dpi: The maximum resolution of the images at their size in the PDF
+            max_workers: The maximum number of images to encode in parallel, the
+                number of CPUs by default
+        """
+        if image_format not in self.FORMATS:
+            raise RuntimeError(f"Unknown PDF image format: {image_format}")
+        self.image_format = image_format
+        self.jpeg_quality = jpeg_quality
+        self.dpi = dpi
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    def encode_images(
+        self, images: Iterable[Tuple[Image.Image, Tuple[float, float]]]
+    ) -> Iterator[Tuple[str, Optional[dict]]]:
+        """Encode the given images in parallel
+
+        Args:
+            images: Pairs of (image, its (width, height) in the PDF in mm)
+
+        Returns: Pairs of (image name, FPDF image info), in the order of the given
+            images. The info is None for an image identical to a previous one.
+        """
+        encoded_names = set()
+        pending: Deque[Tuple[str, Optional[Future]]] = deque()
+        max_pending = self.max_workers * self._IMAGES_IN_FLIGHT_PER_WORKER
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for image, size_mm in images:
+                name = self._get_image_name(image, size_mm)
+                if name in encoded_names:
+                    pending.append((name, None))
+                else:
+                    encoded_names.add(name)
+                    pending.append((name, executor.submit(self.encode, image, size_mm)))
+                while len(pending) > max_pending:
+                    yield self._get_result(pending.popleft())
+            while pending:
+                yield self._get_result(pending.popleft())
+
+    def encode(self, image: Image.Image, size_mm: Tuple[float, float]) -> dict:
+        """Encode a single image, see encode_images
+
+        Returns: The FPDF image info of the image
+        """
+        image = self._resample(image.convert("RGB"), size_mm)
+        buffer = BytesIO()
+        if self.image_format == self.FORMAT_JPEG:
+            image.save(buffer, format="JPEG", quality=self.jpeg_quality)
+            return {
+                "w": image.width,
+                "h": image.height,
+                "cs": "DeviceRGB",
+                "bpc": 8,
+                "f": "DCTDecode",
+                "data": buffer.getvalue(),
+            }
+        image.save(buffer, format="PNG")
+        return {
+            "w": image.width,
+            "h": image.height,
+            "cs": "DeviceRGB",
+            "bpc": 8,
+            "f": "FlateDecode",
+            "dp": f"/Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns {image.width}",
+            "data": self._get_png_image_data(buffer.getvalue()),
+        }
+
+    def _resample(
+        self, image: Image.Image, size_mm: Tuple[float, float]
+    ) -> Image.Image:
+        """Returns: The image downscaled to the target DPI, never upscaled"""
+        target_width = round(size_mm[0] / self._MM_PER_INCH * self.dpi)
+        if target_width >= image.width:
+            return image
+        target_height = max(1, round(image.height * target_width / image.width))
+        return image.resize((target_width, target_height), Image.Resampling.LANCZOS)
+
+    def _get_image_name(self, image: Image.Image, size_mm: Tuple[float, float]) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{image.mode}:{image.size}:{size_mm}".encode("utf-8"))
+        digest.update(image.tobytes())
+        return f"{digest.hexdigest()}.{self.image_format}"
+
+    def _get_png_image_data(self, png_data: bytes) -> bytes:
+        """Returns: The compressed image data of a PNG file, its IDAT chunks"""
+        if not png_data.startswith(self._PNG_SIGNATURE):
+            raise RuntimeError("Not a PNG file")
+        image_data = BytesIO()
+        position = len(self._PNG_SIGNATURE)
+        while position < len(png_data):
+            length, chunk_type = struct.unpack(
+                ">I4s", png_data[position : position + 8]
+            )
+            if chunk_type == b"IDAT":
+                image_data.write(png_data[position + 8 : position + 8 + length])
+            elif chunk_type == b"IEND":
+                break
+            # length, type, data and CRC
+            position += 12 + length
+        return image_data.getvalue()
+
+    @staticmethod
+    def _get_result(
+        pending_image: Tuple[str, Optional[Future]]
+    ) -> Tuple[str, Optional[dict]]:
+        name, future = pending_image
+        return name, future.result() if future else None
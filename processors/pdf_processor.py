@@ -1,8 +1,14 @@
 import os
+import zlib
+from typing import TYPE_CHECKING, Optional, Tuple
 
-from fpdf import FPDF
+from PIL import Image
 
 from data_models import Story
+from processors.pdf_image_encoder import PdfImageEncoder
+
+if TYPE_CHECKING:
+    from fpdf import FPDF
 
 
 class PdfProcessor:
@@ -11,13 +17,86 @@ class PdfProcessor:
     _ORIENTATION: str = "L"
     _SAVE_TO_LOCAL_FILE: str = "F"
 
+    def __init__(self, image_encoder: Optional[PdfImageEncoder] = None):
+        """
+        Args:
+            image_encoder: Encodes the page images ahead of FPDF, fitted to the page.
+                Without it, FPDF embeds the page files as they are.
+        """
+        self.image_encoder = image_encoder
+
     def create_pdf(self, workdir: str, story: Story) -> str:
         """Create PDF for the given story."""
+        from fpdf import FPDF
 
         pdf = FPDF(orientation=self._ORIENTATION, format=self._FORMAT)
         pdf_filepath = os.path.join(workdir, self._FILENAME)
-        for page in story.pages:
-            pdf.add_page()
-            pdf.image(page.page_filepath)
+        if self.image_encoder:
+            self._add_encoded_pages(pdf, story, self.image_encoder)
+        else:
+            for page in story.pages:
+                pdf.add_page()
+                if not os.path.isfile(page.page_filepath):
+                    # The page was only rendered in memory. Otherwise, FPDF copies the
+                    # compressed PNG data of the file as is, which is cheaper.
+                    self._register_image(
+                        pdf, name=page.page_filepath, image=page.get_page_image()
+                    )
+                pdf.image(page.page_filepath)
         pdf.output(pdf_filepath, self._SAVE_TO_LOCAL_FILE)
         return pdf_filepath
+
+    def _add_encoded_pages(
+        self, pdf: "FPDF", story: Story, image_encoder: PdfImageEncoder
+    ) -> None:
+        page_sizes = [
+            self._get_image_size(pdf, page.get_page_size()) for page in story.pages
+        ]
+        # Pages released from memory are read one at a time, as the encoder needs them.
+        encoded_images = image_encoder.encode_images(
+            (page.get_page_image(), page_size)
+            for page, page_size in zip(story.pages, page_sizes)
+        )
+        for (name, info), (width, height) in zip(encoded_images, page_sizes):
+            if info:
+                info["i"] = len(pdf.images) + 1
+                pdf.images[name] = info
+            pdf.add_page()
+            pdf.image(name, w=width, h=height)
+
+    @staticmethod
+    def _get_image_size(
+        pdf: "FPDF", image_size: Tuple[int, int]
+    ) -> Tuple[float, float]:
+        """Returns: The (width, height) to place an image of the given size in pixels
+        at, in the page units. The size FPDF gives an image file (72 DPI), shrunk to
+        fit the margins."""
+        width, height = image_size[0] / pdf.k, image_size[1] / pdf.k
+        max_width = pdf.w - pdf.l_margin - pdf.r_margin
+        max_height = pdf.h - pdf.t_margin - pdf.b_margin
+        scale = min(1.0, max_width / width, max_height / height)
+        return width * scale, height * scale
+
+    @staticmethod
+    def _register_image(pdf: "FPDF", name: str, image: Image.Image) -> None:
+        """Hand the rendered RGB buffer to FPDF under the given name, so FPDF uses it
+        instead of reading and decoding the image file.
+
+        Args:
+            pdf: The PDF to add the image to
+            name: The name FPDF knows the image by, e.g. its filepath
+            image: The image to add
+        """
+        if name in pdf.images:
+            return
+        rgb_image = image if image.mode == "RGB" else image.convert("RGB")
+        # The same image info FPDF builds when it parses an RGB PNG file.
+        pdf.images[name] = {
+            "w": rgb_image.width,
+            "h": rgb_image.height,
+            "cs": "DeviceRGB",
+            "bpc": 8,
+            "f": "FlateDecode",
+            "data": zlib.compress(rgb_image.tobytes()),
+            "i": len(pdf.images) + 1,
+        }
@@ -0,0 +1,124 @@
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
+from typing import Callable, Dict, Hashable, Tuple
+
+from PIL import Image, ImageFont
+
+from data_models import StorySize
+
+
+class RenderAssetCache:
+    """
+    Process wide cache of the assets used to render pages:
+     1. Fonts, loaded once per font size.
+     2. The paper texture, converted and resized once per page size.
+     3. Static pages (e.g. "The End"), rendered and PNG encoded once.
+    Page processors share the instance of their asset files, see get_shared. Render
+    worker processes get a copy without the loaded assets, and load their own.
+    """
+
+    _DEFAULT_MAX_STATIC_PAGES: int = 32
+    _PNG_FORMAT: str = "PNG"
+
+    def __init__(
+        self,
+        font_filepath: str,
+        paper_image_filepath: str,
+        max_static_pages: int = _DEFAULT_MAX_STATIC_PAGES,
+    ):
+        self.font_filepath = font_filepath
+        self.paper_image_filepath = paper_image_filepath
+        self.max_static_pages = max_static_pages
+        self._fonts: Dict[int, ImageFont.FreeTypeFont] = {}
+        self._papers: Dict[Tuple[Tuple[int, int], str], Image.Image] = {}
+        self._static_pages: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def get_shared(
+        cls, font_filepath: str, paper_image_filepath: str
+    ) -> "RenderAssetCache":
+        """Returns: The cache of the given asset files shared by the process"""
+        return cls(
+            font_filepath=font_filepath, paper_image_filepath=paper_image_filepath
+        )
+
+    def __getstate__(self) -> dict:
+        # Fonts and locks can't be pickled, worker processes load their own assets.
+        state = self.__dict__.copy()
+        state["_fonts"] = {}
+        state["_papers"] = {}
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get_font(self, font_size: int) -> ImageFont.FreeTypeFont:
+        with self._lock:
+            if font_size not in self._fonts:
+                self._fonts[font_size] = ImageFont.truetype(
+                    self.font_filepath, font_size
+                )
+            return self._fonts[font_size]
+
+    def get_paper(self, size: Tuple[int, int], mode: str) -> Image.Image:
+        """Returns: The paper texture resized to the given size, must not be modified"""
+        with self._lock:
+            key = (size, mode)
+            if key not in self._papers:
+                paper = Image.open(self.paper_image_filepath).convert(mode)
+                self._papers[key] = paper.resize(size)
+            return self._papers[key]
+
+    def get_static_page(
+        self, key: Hashable, render: Callable[[], Image.Image]
+    ) -> bytes:
+        """Get the PNG encoding of a page that only depends on the given key
+
+        Args:
+            key: Everything the page depends on
+            render: Renders the page on a cache miss
+
+        Returns: The PNG encoded page
+        """
+        with self._lock:
+            if key in self._static_pages:
+                self._static_pages.move_to_end(key)
+                return self._static_pages[key]
+
+        buffer = BytesIO()
+        render().save(buffer, format=self._PNG_FORMAT)
+        png_data = buffer.getvalue()
+        with self._lock:
+            self._static_pages[key] = png_data
+            while len(self._static_pages) > self.max_static_pages:
+                self._static_pages.popitem(last=False)
+        return png_data
+
+    def warm_up(self, story_size: StorySize, title_font_size: int) -> None:
+        """Load the fonts and the paper texture used by pages of the given size"""
+        self.get_font(story_size.font_size)
+        self.get_font(title_font_size)
+        self.get_paper((story_size.page_width, story_size.page_height), "RGB")
+        print(
+            f"Render assets warmed up for {story_size.name}: "
+            f"{self.get_memory_bytes()} bytes"
+        )
+
+    def get_memory_bytes(self) -> int:
+        """Returns: An estimate of the memory held by the cached assets"""
+        with self._lock:
+            # FreeType keeps the font file in memory for every loaded size.
+            fonts = len(self._fonts) * os.path.getsize(self.font_filepath)
+            papers = sum(
+                paper.width * paper.height * len(paper.getbands())
+                for paper in self._papers.values()
+            )
+            static_pages = sum(len(data) for data in self._static_pages.values())
+        return fonts + papers + static_pages
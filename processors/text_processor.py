@@ -1,13 +1,43 @@
-from typing import List
-
-import nltk
+from typing import Iterable, Iterator, List
 
 
 class TextProcessor:
     def process_story_text(self, story_raw_text: str) -> List[str]:
+        import nltk
+
         story_sentences = nltk.sent_tokenize(story_raw_text)
         return [self._clean_text(sentence) for sentence in story_sentences if sentence]
 
+    def iter_processed_sentences(self, text_chunks: Iterable[str]) -> Iterator[str]:
+        """Split streamed story text into processed sentences as they complete
+
+        A sentence is considered complete once the tokenizer starts another sentence
+        after it, only the trailing (possibly unfinished) sentence is kept pending.
+
+        Args:
+            text_chunks: The story text, chunk by chunk
+
+        Returns: The processed sentences, in order
+        """
+        import nltk
+
+        pending_text = ""
+        for chunk in text_chunks:
+            pending_text += chunk
+            sentences = nltk.sent_tokenize(pending_text)
+            if len(sentences) < 2:
+                continue
+            for sentence in sentences[:-1]:
+                if sentence:
+                    yield self._clean_text(sentence)
+            # The tokenizer returns slices of the text, so the last sentence is found
+            # at its original position.
+            pending_text = pending_text[pending_text.rindex(sentences[-1]) :]
+
+        for sentence in nltk.sent_tokenize(pending_text):
+            if sentence:
+                yield self._clean_text(sentence)
+
     @staticmethod
     def _clean_text(text: str) -> str:
         return text.strip().replace("\n", "")
@@ -0,0 +1,289 @@
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from data_models import VideoRendition
+
+
+class VideoEncoder:
+    """
+    Encode a story video from still pages with ffmpeg directly, either as:
+     1. A slideshow - Every page is sent to the encoder once, with its duration. The
+        video has a variable frame rate, one frame per page, and a keyframe at the
+        start of every page, so seeking lands on page boundaries.
+     2. Segments - Every page is encoded to its own constant frame rate segment, in
+        parallel, with the same codec parameters. The segments are then joined
+        without encoding them again.
+    In both cases the finished audio track is muxed in.
+    """
+
+    _VIDEO_CODEC: str = "libx264"
+    _TUNE: str = "stillimage"
+    _PIXEL_FORMAT: str = "yuv420p"
+    # yuv420p needs even dimensions, pages that are not get one more black row/column.
+    _EVEN_SIZE_FILTER: str = "pad=ceil(iw/2)*2:ceil(ih/2)*2"
+    # -2 keeps the aspect ratio with an even width.
+    _SCALE_FILTER: str = "scale=-2:{height}"
+    _TIME_SCALE: int = 1000
+    _AUDIO_CODEC: str = "aac"
+    _AUDIO_BITRATE: str = "192k"
+    _SEGMENT_FPS: int = 24
+    _SEGMENT_EXT: str = ".mp4"
+
+    def __init__(
+        self, ffmpeg_binary: Optional[str] = None, max_workers: Optional[int] = None
+    ):
+        """
+        Args:
+            ffmpeg_binary: The ffmpeg executable, the one moviepy uses by default
+            max_workers: The maximum number of segments to encode in parallel,
+                the number of CPUs by default
+        """
+        self._ffmpeg_binary = ffmpeg_binary
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    @property
+    def ffmpeg_binary(self) -> str:
+        if self._ffmpeg_binary is None:
+            # moviepy is slow to import, only import it when encoding.
+            from moviepy.config import get_setting
+
+            self._ffmpeg_binary = get_setting("FFMPEG_BINARY")
+        return self._ffmpeg_binary
+
+    def encode_slideshow(
+        self,
+        frames: List[Tuple[str, float]],
+        audio_filepath: str,
+        output_filepath: str,
+        rendition: VideoRendition,
+    ) -> str:
+        """Encode the given still frames and audio track into a video
+
+        Args:
+            frames: Pairs of (image filepath, duration in seconds), in order
+            audio_filepath: The audio track of the whole video
+            output_filepath: Where to save the video
+            rendition: The encoder settings of the video
+
+        Returns: The output filepath
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            concat_filepath = os.path.join(tmpdir, "frames.ffconcat")
+            self._write_concat_file(concat_filepath, self._get_frame_entries(frames))
+            command = [
+                self.ffmpeg_binary,
+                "-y",
+                "-v",
+                "error",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                concat_filepath,
+                "-i",
+                audio_filepath,
+                "-map",
+                "0:v:0",
+                "-map",
+                "1:a:0",
+                "-vf",
+                self._get_video_filter(rendition),
+                "-vsync",
+                "vfr",
+                "-enc_time_base",
+                f"1:{self._TIME_SCALE}",
+                # Every frame is the start of a page.
+                "-force_key_frames",
+                "expr:1",
+                *self._get_video_codec_args(rendition, threads=rendition.threads),
+                "-c:a",
+                self._AUDIO_CODEC,
+                "-b:a",
+                self._AUDIO_BITRATE,
+                "-movflags",
+                "+faststart",
+                output_filepath,
+            ]
+            self._run(command)
+        return output_filepath
+
+    def encode_segments(
+        self,
+        frames: List[Tuple[str, float]],
+        audio_filepath: str,
+        output_filepath: str,
+        rendition: VideoRendition,
+    ) -> str:
+        """Encode every still frame to its own segment in parallel, then join the
+        segments and the audio track into a video
+
+        Args:
+            frames: Pairs of (image filepath, duration in seconds), in order
+            audio_filepath: The audio track of the whole video
+            output_filepath: Where to save the video
+            rendition: The encoder settings of the video
+
+        Returns: The output filepath
+        """
+        frame_counts = self._get_frame_counts([duration for _, duration in frames])
+        max_workers = min(self.max_workers, len(frames))
+        # Split the CPUs between the parallel encoders, instead of each using all.
+        threads = rendition.threads or max(1, (os.cpu_count() or 1) // max_workers)
+        print(f"Encoding {len(frames)} video segments with {max_workers} workers")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            segment_filepaths = [
+                os.path.join(tmpdir, f"segment_{i:04d}{self._SEGMENT_EXT}")
+                for i in range(len(frames))
+            ]
+            # The work is done by the ffmpeg processes, threads are enough to run them.
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                segment_futures = [
+                    executor.submit(
+                        self._encode_segment,
+                        image_filepath=image_filepath,
+                        frame_count=frame_count,
+                        segment_filepath=segment_filepath,
+                        rendition=rendition,
+                        threads=threads,
+                    )
+                    for (image_filepath, _), frame_count, segment_filepath in zip(
+                        frames, frame_counts, segment_filepaths
+                    )
+                ]
+                for segment_future in segment_futures:
+                    segment_future.result()
+
+            concat_filepath = os.path.join(tmpdir, "segments.ffconcat")
+            self._write_concat_file(
+                concat_filepath,
+                [
+                    self._get_concat_file_line(filepath)
+                    for filepath in segment_filepaths
+                ],
+            )
+            command = [
+                self.ffmpeg_binary,
+                "-y",
+                "-v",
+                "error",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                concat_filepath,
+                "-i",
+                audio_filepath,
+                "-map",
+                "0:v:0",
+                "-map",
+                "1:a:0",
+                "-c:v",
+                "copy",
+                "-c:a",
+                self._AUDIO_CODEC,
+                "-b:a",
+                self._AUDIO_BITRATE,
+                "-movflags",
+                "+faststart",
+                output_filepath,
+            ]
+            self._run(command)
+        return output_filepath
+
+    def _encode_segment(
+        self,
+        image_filepath: str,
+        frame_count: int,
+        segment_filepath: str,
+        rendition: VideoRendition,
+        threads: int,
+    ) -> None:
+        command = [
+            self.ffmpeg_binary,
+            "-y",
+            "-v",
+            "error",
+            "-loop",
+            "1",
+            "-framerate",
+            str(self._SEGMENT_FPS),
+            "-i",
+            image_filepath,
+            "-frames:v",
+            str(frame_count),
+            "-vf",
+            self._get_video_filter(rendition),
+            *self._get_video_codec_args(rendition, threads=threads),
+            "-video_track_timescale",
+            str(self._SEGMENT_FPS * self._TIME_SCALE),
+            "-an",
+            segment_filepath,
+        ]
+        self._run(command)
+
+    def _get_video_filter(self, rendition: VideoRendition) -> str:
+        if rendition.height:
+            scale_filter = self._SCALE_FILTER.format(height=rendition.height)
+            return f"{scale_filter},{self._EVEN_SIZE_FILTER}"
+        return self._EVEN_SIZE_FILTER
+
+    def _get_video_codec_args(
+        self, rendition: VideoRendition, threads: Optional[int]
+    ) -> List[str]:
+        args = ["-c:v", self._VIDEO_CODEC, "-preset", rendition.preset]
+        if rendition.bitrate:
+            args += ["-b:v", rendition.bitrate]
+        elif rendition.crf is not None:
+            args += ["-crf", str(rendition.crf)]
+        args += ["-tune", self._TUNE, "-pix_fmt", self._PIXEL_FORMAT]
+        if threads:
+            args += ["-threads", str(threads)]
+        return args
+
+    def _get_frame_counts(self, durations: List[float]) -> List[int]:
+        """Returns: The number of frames of every segment. The boundaries are rounded
+        on the cumulative time, so the rounding errors don't add up over the video"""
+        frame_counts = []
+        start_frame = 0
+        current_end = 0.0
+        for duration in durations:
+            current_end += duration
+            end_frame = int(round(current_end * self._SEGMENT_FPS))
+            frame_counts.append(max(1, end_frame - start_frame))
+            start_frame += frame_counts[-1]
+        return frame_counts
+
+    @classmethod
+    def _get_frame_entries(cls, frames: List[Tuple[str, float]]) -> List[str]:
+        lines = []
+        for filepath, duration in frames:
+            lines.append(cls._get_concat_file_line(filepath))
+            # Images are read at 25 fps by default, which rounds the page durations.
+            lines.append(f"option framerate {cls._TIME_SCALE}")
+            lines.append(f"duration {duration:.6f}")
+        # The concat demuxer ignores the duration of the last entry, unless the
+        # last file is listed once more.
+        lines.append(cls._get_concat_file_line(frames[-1][0]))
+        lines.append(f"option framerate {cls._TIME_SCALE}")
+        return lines
+
+    @staticmethod
+    def _get_concat_file_line(filepath: str) -> str:
+        escaped_filepath = os.path.abspath(filepath).replace("'", "'\\''")
+        return f"file '{escaped_filepath}'"
+
+    @staticmethod
+    def _write_concat_file(concat_filepath: str, entries: List[str]) -> None:
+        with open(concat_filepath, "w") as file:
+            file.write("\n".join(["ffconcat version 1.0", *entries]) + "\n")
+
+    @staticmethod
+    def _run(command: List[str]) -> None:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {result.stderr.decode()}")
@@ -1,15 +1,19 @@
+import bisect
 import os
 import random
+import tempfile
 from os import listdir
 from os.path import isfile, join
-from typing import List
+from typing import TYPE_CHECKING, List, Optional
 
-from moviepy.audio.fx.volumex import volumex
+import numpy
 
-from data_models import Story
+from data_models import Story, StoryPage, VideoRendition
+from processors.audio_timeline import AudioTimeline
+from processors.video_encoder import VideoEncoder
 
-import moviepy.editor as mpy
-import moviepy.audio.fx.all as afx
+if TYPE_CHECKING:
+    from moviepy.video.VideoClip import VideoClip
 
 
 class VideoProcessor:
@@ -24,6 +28,41 @@ class VideoProcessor:
     """Each page duration is set to the length of the text to speech audio + audio_gap"""
     _AUDIO_GAP: float = 0.5
 
+    MODE_COMPOSE: str = "compose"
+    MODE_SLIDESHOW: str = "slideshow"
+    MODE_SEGMENTS: str = "segments"
+    MODES: List[str] = [MODE_COMPOSE, MODE_SLIDESHOW, MODE_SEGMENTS]
+
+    # Written to final_video.mp4, other renditions add their name to the filename.
+    DEFAULT_RENDITION: VideoRendition = VideoRendition(name="default")
+
+    _FRAME_EXT: str = ".ppm"
+
+    def __init__(
+        self,
+        audio_timeline: AudioTimeline,
+        video_encoder: Optional[VideoEncoder] = None,
+        mode: str = MODE_COMPOSE,
+        renditions: Optional[List[VideoRendition]] = None,
+    ):
+        """
+        Args:
+            audio_timeline: Assembles the audio track of the video
+            video_encoder: Encodes the video in the slideshow and segments modes, and
+                the renditions after the first one in the compose mode
+            mode: compose - Composite and encode every frame at a fixed fps with moviepy.
+                slideshow - Send every page to the encoder once, with its duration.
+                segments - Encode every page to a segment in parallel and join them.
+            renditions: The videos to create, all from the same pages and audio. The
+                first one is the main video of the story.
+        """
+        if mode not in self.MODES:
+            raise RuntimeError(f"Unknown video mode: {mode}")
+        self.audio_timeline = audio_timeline
+        self.video_encoder = video_encoder or VideoEncoder()
+        self.mode = mode
+        self.renditions = renditions or [self.DEFAULT_RENDITION]
+
     def generate_video(self, workdir: str, story: Story) -> str:
         """Create a video for the given story
 
@@ -31,47 +70,147 @@ class VideoProcessor:
             workdir: The root workdir for the story to generate video for
             story: The story object that contains all details about the story
 
-        Returns: A local filepath for where the created video is stored
+        Returns: A local filepath for where the video of the first rendition is stored
         """
-        page_clips = []
-        audio_clips = []
+        page_durations = []
+        page_audios = []
         current_start = 0.0
-        for i in range(len(story.pages)):
-            page = story.pages[i]
-            page_clip = mpy.ImageClip(page.page_filepath).set_duration(
-                page.audio.length_in_seconds + self._AUDIO_GAP
-            )
-            page_clips.append(page_clip)
-            audio_clip = mpy.AudioFileClip(story.pages[i].audio.mp3_file).set_start(
-                current_start
-            )
-            audio_clips.append(audio_clip)
+        for page in story.pages:
+            page_duration = page.audio.length_in_seconds + self._AUDIO_GAP
+            page_durations.append(page_duration)
+            page_audios.append((page.audio.mp3_file, current_start))
             # keep track of the current length
-            current_start += page.audio.length_in_seconds + self._AUDIO_GAP
+            current_start += page_duration
 
-        clip = mpy.concatenate_videoclips(page_clips, method="compose")
-        full_audio_clip = mpy.CompositeAudioClip(audio_clips)
-        full_audio_clip.write_audiofile(
-            os.path.join(workdir, f"final_audio.wav"), fps=44100
+        background_music_filepath = self._get_background_music_filename()
+        print(f"Background music filepath: {background_music_filepath}")
+        full_audio = self.audio_timeline.assemble(
+            page_audios=page_audios,
+            duration_in_seconds=current_start,
+            background_music_filepath=background_music_filepath,
+            background_music_volume=self._BACKGROUND_MUSIC_VOLUME_FACTOR,
+        )
+        audio_filepath = self.audio_timeline.write_wav(
+            full_audio, os.path.join(workdir, f"final_audio.wav")
         )
 
-        clip.audio = full_audio_clip
-        self._add_background_music(clip)
-        clip_filepath = os.path.join(workdir, self._FILENAME)
-        clip.write_videofile(clip_filepath, fps=self._FPS)
-        return clip_filepath
+        video_filepaths = []
+        renditions = self.renditions
+        if self.mode == self.MODE_COMPOSE:
+            # moviepy.editor is slow to import, only import it when it is used.
+            import moviepy.editor as mpy
+            from moviepy.audio.AudioClip import AudioArrayClip
 
-    def _add_background_music(self, video_clip):
-        background_music_filepath = self._get_background_music_filename()
-        print(f"Background music filepath: {background_music_filepath}")
-        background_music = mpy.AudioFileClip(background_music_filepath).fx(
-            volumex, self._BACKGROUND_MUSIC_VOLUME_FACTOR
+            if all(page.page_image is not None for page in story.pages):
+                page_clips = [
+                    # The rendered RGB page, instead of decoding the page file again.
+                    mpy.ImageClip(numpy.asarray(page.page_image)).set_duration(
+                        page_duration
+                    )
+                    for page, page_duration in zip(story.pages, page_durations)
+                ]
+                clip = mpy.concatenate_videoclips(page_clips, method="compose")
+            else:
+                clip = self._create_page_reader_clip(
+                    story.pages,
+                    page_starts=[page_start for _, page_start in page_audios],
+                    duration=current_start,
+                )
+            clip.audio = AudioArrayClip(full_audio, fps=self.audio_timeline.sample_rate)
+            main_rendition = self.renditions[0]
+            main_video_filepath = self._get_video_filepath(workdir, main_rendition)
+            clip.write_videofile(
+                main_video_filepath,
+                fps=self._FPS,
+                preset=main_rendition.preset,
+                bitrate=main_rendition.bitrate,
+                threads=main_rendition.threads,
+                ffmpeg_params=self._get_ffmpeg_params(main_rendition),
+            )
+            video_filepaths.append(main_video_filepath)
+            # Compositing every frame is the slow part, the other renditions are
+            # encoded as slideshows of the same pages and audio instead.
+            renditions = self.renditions[1:]
+            if not renditions:
+                return main_video_filepath
+
+        encode = (
+            self.video_encoder.encode_segments
+            if self.mode == self.MODE_SEGMENTS
+            else self.video_encoder.encode_slideshow
         )
-        background_music = afx.audio_loop(
-            background_music, duration=video_clip.duration
+        with tempfile.TemporaryDirectory() as frames_dir:
+            frames = [
+                (self._get_frame_filepath(page, frames_dir), page_duration)
+                for page, page_duration in zip(story.pages, page_durations)
+            ]
+            for rendition in renditions:
+                video_filepath = self._get_video_filepath(workdir, rendition)
+                encode(
+                    frames=frames,
+                    audio_filepath=audio_filepath,
+                    output_filepath=video_filepath,
+                    rendition=rendition,
+                )
+                video_filepaths.append(video_filepath)
+        return video_filepaths[0]
+
+    @staticmethod
+    def _create_page_reader_clip(
+        pages: List[StoryPage], page_starts: List[float], duration: float
+    ) -> "VideoClip":
+        """Returns: A clip of the given pages, for pages released from memory. Only
+        the page being encoded is decoded, it is read from its file when the frames
+        reach it."""
+        import moviepy.editor as mpy
+
+        current_index = -1
+        current_frame: Optional[numpy.ndarray] = None
+
+        def make_frame(t: float) -> numpy.ndarray:
+            nonlocal current_index, current_frame
+            index = max(0, bisect.bisect_right(page_starts, t) - 1)
+            if current_frame is None or index != current_index:
+                current_index = index
+                current_frame = numpy.asarray(
+                    pages[index].get_page_image().convert("RGB")
+                )
+            return current_frame
+
+        return mpy.VideoClip(make_frame, duration=duration)
+
+    def _get_video_filepath(self, workdir: str, rendition: VideoRendition) -> str:
+        if rendition.name == self.DEFAULT_RENDITION.name:
+            return os.path.join(workdir, self._FILENAME)
+        name, ext = os.path.splitext(self._FILENAME)
+        return os.path.join(workdir, f"{name}_{rendition.name}{ext}")
+
+    def _get_ffmpeg_params(self, rendition: VideoRendition) -> Optional[List[str]]:
+        """Returns: The extra ffmpeg parameters moviepy doesn't have arguments for"""
+        ffmpeg_params = []
+        if rendition.crf is not None and not rendition.bitrate:
+            ffmpeg_params += ["-crf", str(rendition.crf)]
+        if rendition.height:
+            # -2 keeps the aspect ratio with an even width, as yuv420p requires.
+            ffmpeg_params += [
+                "-vf",
+                f"scale=-2:{rendition.height // 2 * 2}",
+                "-pix_fmt",
+                "yuv420p",
+            ]
+        return ffmpeg_params or None
+
+    def _get_frame_filepath(self, page: StoryPage, frames_dir: str) -> str:
+        """Returns: An image file of the page, for the encoder to read"""
+        if isfile(page.page_filepath):
+            return page.page_filepath
+        # The page was only rendered in memory, save it uncompressed since the
+        # encoder reads it only once.
+        frame_filepath = join(
+            frames_dir, f"page_{page.page_content.page_number}{self._FRAME_EXT}"
         )
-        video_clip.audio = mpy.CompositeAudioClip([video_clip.audio, background_music])
-        return video_clip
+        page.get_page_image().save(frame_filepath)
+        return frame_filepath
 
     def _get_background_music_filename(self) -> str:
         """Returns: A path to a mp3 file to be used as a background music."""
@@ -1,11 +1,48 @@
-from typing import List
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Optional, Tuple
 
-from data_models import Story, StoryPage, StoryContent, CombinedWorkdir, StorySize
+from PIL import Image
+
+from data_models import (
+    Story,
+    StoryPage,
+    StoryContent,
+    CombinedWorkdir,
+    StorySize,
+    StoryPageContent,
+)
 from generators.audio_generator_abstract import AbstractAudioGenerator
 from generators.keywords_generator import KeywordsGenerator
 from processors.page_processor import PageProcessor
 from processors.pdf_processor import PdfProcessor
 from processors.video_processor import VideoProcessor
+from util.image_writer import ImageWriter
+
+
+# The page processor of a render worker process, set once by _init_render_worker.
+_worker_page_processor: Optional[PageProcessor] = None
+
+
+def _init_render_worker(page_processor: PageProcessor, story_size: StorySize) -> None:
+    global _worker_page_processor
+    _worker_page_processor = page_processor
+    _worker_page_processor.warm_up(story_size)
+
+
+def _render_page_in_worker(
+    workdir: str,
+    story_page_content: StoryPageContent,
+    story_size: StorySize,
+    return_page_image: bool = True,
+) -> Tuple[Optional[Image.Image], str]:
+    assert _worker_page_processor is not None
+    page_image, page_filepath = _worker_page_processor.render_page(
+        workdir=workdir, story_page_content=story_page_content, story_size=story_size
+    )
+    # The page is sent back to the main process, which doesn't track this write.
+    _worker_page_processor.flush()
+    return page_image if return_page_image else None, page_filepath
 
 
 class StoryManager:
@@ -25,26 +62,39 @@ class StoryManager:
         page_processor: PageProcessor,
         pdf_processor: PdfProcessor,
         video_processor: VideoProcessor,
+        audio_concurrency: int = 1,
+        render_workers: int = 1,
+        stream_window: Optional[int] = None,
     ):
+        """
+        Args:
+            stream_window: The maximum number of pages whose images are kept in
+                memory. Older pages are released once their page file is written,
+                the PDF and the video read them back from the files. All the pages
+                are kept in memory by default. With render workers, every page is
+                released as soon as it is rendered.
+        """
+        if stream_window is not None and stream_window < 1:
+            raise RuntimeError(f"The stream window must be at least 1: {stream_window}")
+        if stream_window and page_processor.image_writer.mode == ImageWriter.MODE_OFF:
+            raise RuntimeError("Streaming the pages requires writing the page files")
         self.audio_generator = audio_generator
+        self.audio_concurrency = audio_concurrency
+        self.render_workers = render_workers
+        self.stream_window = stream_window
         self.keywords_generator = keywords_generator
         self.page_processor = page_processor
         self.pdf_processor = pdf_processor
         self.video_processor = video_processor
 
     def invoke(self, combined_workdir: CombinedWorkdir, story_content: StoryContent):
-        story_pages: List[StoryPage] = []
-        for page_content in story_content.page_contents:
-            audio = self.audio_generator.generate_audio(
-                workdir=combined_workdir.workdir_audio, story_page_content=page_content
+        self.page_processor.warm_up(story_content.story_size)
+        if self.render_workers > 1:
+            story_pages = self._create_pages_in_parallel(
+                combined_workdir, story_content
             )
-            page: StoryPage = self.page_processor.create_page(
-                workdir=combined_workdir.workdir_pages,
-                story_page_content=page_content,
-                audio=audio,
-                story_size=story_content.story_size,
-            )
-            story_pages.append(page)
+        else:
+            story_pages = self._create_pages(combined_workdir, story_content)
 
         start_page_filepath = self.page_processor.create_start_page(
             workdir=combined_workdir.workdir_pages,
@@ -67,7 +117,100 @@ class StoryManager:
             keywords=keywords,
         )
 
+        # The PDF uses the page files when they are saved.
+        self.page_processor.flush()
         self.pdf_processor.create_pdf(workdir=combined_workdir.workdir, story=story)
         self.video_processor.generate_video(
             workdir=combined_workdir.workdir, story=story
         )
+
+    def _create_pages(
+        self, combined_workdir: CombinedWorkdir, story_content: StoryContent
+    ) -> List[StoryPage]:
+        audios = self.audio_generator.generate_audios(
+            workdir=combined_workdir.workdir_audio,
+            story_page_contents=story_content.page_contents,
+            max_workers=self.audio_concurrency,
+        )
+        story_pages: List[StoryPage] = []
+        num_released_pages = 0
+        for page_content, audio in zip(story_content.page_contents, audios):
+            page: StoryPage = self.page_processor.create_page(
+                workdir=combined_workdir.workdir_pages,
+                story_page_content=page_content,
+                audio=audio,
+                story_size=story_content.story_size,
+            )
+            story_pages.append(page)
+            if (
+                self.stream_window
+                and len(story_pages) - num_released_pages >= self.stream_window
+            ):
+                self._release_images(story_pages[num_released_pages:])
+                num_released_pages = len(story_pages)
+        if self.stream_window:
+            self._release_images(story_pages[num_released_pages:])
+        return story_pages
+
+    def _create_pages_in_parallel(
+        self, combined_workdir: CombinedWorkdir, story_content: StoryContent
+    ) -> List[StoryPage]:
+        """Render the pages in a process pool while the audio is being generated
+
+        Returns: The story pages, in the same order as the page contents
+        """
+        page_contents = story_content.page_contents
+        if self.stream_window:
+            # The workers read the images from their files, and keep the pages.
+            self._release_source_images(page_contents)
+        max_workers = min(self.render_workers, len(page_contents)) or 1
+        print(f"Rendering {len(page_contents)} pages with {max_workers} processes")
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_render_worker,
+            initargs=(self.page_processor, story_content.story_size),
+        ) as executor:
+            render_futures: List[Future] = [
+                executor.submit(
+                    _render_page_in_worker,
+                    combined_workdir.workdir_pages,
+                    page_content,
+                    story_content.story_size,
+                    not self.stream_window,
+                )
+                for page_content in page_contents
+            ]
+            audios = self.audio_generator.generate_audios(
+                workdir=combined_workdir.workdir_audio,
+                story_page_contents=page_contents,
+                max_workers=self.audio_concurrency,
+            )
+            story_pages: List[StoryPage] = []
+            for page_content, audio, render_future in zip(
+                page_contents, audios, render_futures
+            ):
+                page_image, page_filepath = render_future.result()
+                story_pages.append(
+                    StoryPage(
+                        page_content=page_content,
+                        page_image=page_image,
+                        page_filepath=page_filepath,
+                        audio=audio,
+                    )
+                )
+        return story_pages
+
+    def _release_images(self, story_pages: List[StoryPage]) -> None:
+        """Release the images of the given pages from memory, once their page files
+        are written. They are read back from the files when they are needed."""
+        self.page_processor.flush()
+        for page in story_pages:
+            page.page_image = None
+        self._release_source_images([page.page_content for page in story_pages])
+
+    @staticmethod
+    def _release_source_images(page_contents: List[StoryPageContent]) -> None:
+        """Release the source images that can be read back from their files"""
+        for page_content in page_contents:
+            if os.path.isfile(page_content.image_path):
+                page_content.image = None
@@ -39,9 +39,7 @@ class StoryProvider:
             # If a pickle file is provided, read it then create a new workdir based on the observed story seed.
             # This enables continuation without recalling expensive text/image generation APIs.
             # And it also avoids overriding previous work, always create a new workdir.
-            story_content = self.story_utility.load_story_from_pickle(
-                pickle_file=pickle_file
-            )
+            story_content = self.story_utility.load_story(story_file=pickle_file)
             combined_workdir: CombinedWorkdir = self.story_utility.new_workdir(
                 story_content.story_seed
             )
@@ -58,6 +56,7 @@ class StoryProvider:
 
         # Save the story content anyway. If it's new, save it for later access/continuation.
         # If it's loaded from pickle, re-save it to the new workdir for easy debugging.
+        # The manifest is saved with a copy of the images, so the new workdir is complete.
         self.story_utility.save_story(
             workdir=combined_workdir.workdir, story_content=story_content
         )
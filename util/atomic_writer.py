@@ -0,0 +1,39 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import IO, Any, Iterator
+
+
+class AtomicWriter:
+    """
+    Write files through a temporary file next to them, which replaces them only once
+    it is complete, so readers never observe a partial file. If writing fails, the
+    temporary file is removed and the file is left as it was.
+    """
+
+    TMP_EXT: str = ".tmp"
+
+    @staticmethod
+    @contextmanager
+    def tmp_filepath(filepath: str) -> Iterator[str]:
+        """Yields: The temporary file to write, it replaces the given file when the
+        block completes"""
+        # Unique per thread, so concurrent writers of the same file don't collide.
+        tmp_filepath = (
+            f"{filepath}.{os.getpid()}-{threading.get_ident()}{AtomicWriter.TMP_EXT}"
+        )
+        try:
+            yield tmp_filepath
+            os.replace(tmp_filepath, filepath)
+        except BaseException:
+            if os.path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
+            raise
+
+    @staticmethod
+    @contextmanager
+    def open(filepath: str, mode: str = "w") -> Iterator[IO[Any]]:
+        """Yields: The temporary file opened with the given mode, see tmp_filepath"""
+        with AtomicWriter.tmp_filepath(filepath) as tmp_filepath:
+            with open(tmp_filepath, mode) as file:
+                yield file
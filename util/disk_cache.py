@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from util.atomic_writer import AtomicWriter
+
+
+class DiskCache:
+    """A persistent, content addressed cache of files with a size cap.
+
+    Every entry is stored as `<key><extension>` inside the cache directory, where
+    the key is a hash of the parts that identify the content. Files sharing the
+    same key form one entry and are evicted together, least recently used first,
+    once the total size of the cache exceeds the configured maximum. The entry
+    that was just stored is never evicted by its own put, so an entry larger than
+    the maximum stays until the next put.
+
+    The modification time of a cached file is the time it was written and is used
+    for age based expiry, while its access time is updated explicitly on every hit
+    and is used for the least recently used ordering.
+    """
+
+    _JSON_EXT: str = ".json"
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_size_bytes: int,
+        max_age_seconds: Optional[float] = None,
+    ):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """Build a cache key from the given parts
+
+        Args:
+            parts: The values that identify the cached content
+
+        Returns: A hex digest that can be used as a file name
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, key: str, extension: str) -> Optional[str]:
+        """Look up a cached file and mark it as recently used
+
+        Args:
+            key: The key of the entry, see make_key
+            extension: The extension of the cached file e.g. ".png"
+
+        Returns: The path of the cached file or None on a cache miss. The file can
+            be evicted by a concurrent put, use get_copy to copy it safely.
+        """
+        with self._lock:
+            return self._lookup(key, extension)
+
+    def get_copy(self, key: str, extension: str, destination_filepath: str) -> bool:
+        """Copy a cached file and mark it as recently used, see get
+
+        The file is copied while holding the lock, so a concurrent put can't evict
+        it in between.
+
+        Args:
+            key: The key of the entry, see make_key
+            extension: The extension of the cached file e.g. ".png"
+            destination_filepath: Where to copy the cached file
+
+        Returns: True on a cache hit, False on a cache miss
+        """
+        with self._lock:
+            filepath = self._lookup(key, extension)
+            if filepath is None:
+                return False
+            shutil.copyfile(filepath, destination_filepath)
+            return True
+
+    def get_json(self, key: str) -> Optional[Any]:
+        """Look up a cached JSON document, see get"""
+        filepath = self.get(key, self._JSON_EXT)
+        if filepath is None:
+            return None
+        with open(filepath) as file:
+            return json.load(file)
+
+    def read_json(self, key: str) -> Optional[Any]:
+        """Read the JSON document of an entry without counting a hit or a miss
+
+        This is meant for metadata stored next to a file that was looked up with get.
+        """
+        try:
+            with open(self._get_filepath(key, self._JSON_EXT)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, extension: str, source_filepath: str) -> str:
+        """Copy the given file into the cache
+
+        Args:
+            key: The key of the entry, see make_key
+            extension: The extension of the cached file e.g. ".png"
+            source_filepath: The file to store in the cache
+
+        Returns: The path of the cached file
+        """
+        filepath = self._get_filepath(key, extension)
+        with AtomicWriter.tmp_filepath(filepath) as tmp_filepath:
+            shutil.copyfile(source_filepath, tmp_filepath)
+        self._evict_after_put(key)
+        return filepath
+
+    def put_written(
+        self, key: str, extension: str, write: Callable[[str], None]
+    ) -> str:
+        """Store a file in the cache by writing it in place, see put
+
+        This saves copying large files produced only to be cached.
+
+        Args:
+            key: The key of the entry, see make_key
+            extension: The extension of the cached file e.g. ".png"
+            write: Writes the file to the given path, a temporary file in the cache
+
+        Returns: The path of the cached file
+        """
+        filepath = self._get_filepath(key, extension)
+        with AtomicWriter.tmp_filepath(filepath) as tmp_filepath:
+            write(tmp_filepath)
+        self._evict_after_put(key)
+        return filepath
+
+    def put_json(self, key: str, data: Any) -> str:
+        """Store a JSON document in the cache, see put"""
+        filepath = self._get_filepath(key, self._JSON_EXT)
+        with AtomicWriter.open(filepath) as file:
+            json.dump(data, file)
+        self._evict_after_put(key)
+        return filepath
+
+    def _lookup(self, key: str, extension: str) -> Optional[str]:
+        """Look up a cached file, the lock must be held"""
+        filepath = self._get_filepath(key, extension)
+        if not os.path.isfile(filepath):
+            self.misses += 1
+            return None
+        written_at = os.stat(filepath).st_mtime
+        if self._is_expired(written_at, time.time()):
+            self._remove_entry(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        os.utime(filepath, (time.time(), written_at))
+        return filepath
+
+    def stats(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses ({self.cache_dir})"
+
+    def _get_filepath(self, key: str, extension: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}{extension}")
+
+    def _evict_after_put(self, key: str) -> None:
+        with self._lock:
+            self._evict(keep_key=key)
+
+    def _is_expired(self, written_at: float, now: float) -> bool:
+        return (
+            self.max_age_seconds is not None and now - written_at > self.max_age_seconds
+        )
+
+    def _list_entries(self) -> Dict[str, List[str]]:
+        entries: Dict[str, List[str]] = {}
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith(AtomicWriter.TMP_EXT):
+                continue
+            key = filename.split(".", 1)[0]
+            entries.setdefault(key, []).append(os.path.join(self.cache_dir, filename))
+        return entries
+
+    def _remove_entry(self, key: str) -> None:
+        for filepath in self._list_entries().get(key, []):
+            os.remove(filepath)
+
+    def _evict(self, keep_key: str) -> None:
+        """Remove expired entries, then least recently used entries until the cache
+        fits its size cap. The entry of the given key is counted but kept."""
+        now = time.time()
+        # (last access time, size, files) for every entry
+        usage: List[Tuple[float, int, List[str]]] = []
+        total_size = 0
+        for key, filepaths in self._list_entries().items():
+            if key == keep_key:
+                total_size += sum(os.path.getsize(filepath) for filepath in filepaths)
+                continue
+            stats = [os.stat(filepath) for filepath in filepaths]
+            if self._is_expired(min(stat.st_mtime for stat in stats), now):
+                for filepath in filepaths:
+                    os.remove(filepath)
+                continue
+            size = sum(stat.st_size for stat in stats)
+            usage.append((max(stat.st_atime for stat in stats), size, filepaths))
+            total_size += size
+
+        usage.sort(key=lambda entry: entry[0])
+        for _, size, filepaths in usage:
+            if total_size <= self.max_size_bytes:
+                break
+            for filepath in filepaths:
+                os.remove(filepath)
+            total_size -= size
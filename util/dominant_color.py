@@ -0,0 +1,78 @@
+import math
+from typing import Tuple
+
+import numpy
+from PIL import Image
+
+
+class DominantColorEngine:
+    """
+    Find the dominant color of an image:
+     1. Downscale the image to a small working size.
+     2. Sample at most a fixed number of pixels from it.
+     3. Count the pixels per quantized color with a single histogram.
+     4. Return the average color of the most common quantized color.
+    Not memoized, hashing a full resolution image takes longer than all the steps.
+    """
+
+    _DEFAULT_MAX_SIDE: int = 128
+    _DEFAULT_MAX_SAMPLES: int = 16384
+    _DEFAULT_BITS_PER_CHANNEL: int = 4
+    # Like color thief, ignore transparent and almost white pixels.
+    _MIN_ALPHA: int = 125
+    _WHITE_THRESHOLD: int = 250
+
+    def __init__(
+        self,
+        max_side: int = _DEFAULT_MAX_SIDE,
+        max_samples: int = _DEFAULT_MAX_SAMPLES,
+        bits_per_channel: int = _DEFAULT_BITS_PER_CHANNEL,
+    ):
+        self.max_side = max_side
+        self.max_samples = max_samples
+        self.bits_per_channel = bits_per_channel
+
+    def get_dominant_color(self, image: Image.Image) -> Tuple[int, int, int]:
+        """Find the dominant color of the given image
+
+        Args:
+            image: The image to analyze
+
+        Returns: The dominant color (r, g, b)
+        """
+        return self._calculate(self._downscale(image))
+
+    def _downscale(self, image: Image.Image) -> Image.Image:
+        reduce_factor = max(1, math.ceil(max(image.size) / self.max_side))
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        return image.reduce(reduce_factor).convert("RGBA")
+
+    def _calculate(self, small_image: Image.Image) -> Tuple[int, int, int]:
+        pixels = numpy.asarray(small_image).reshape(-1, 4)
+        if len(pixels) > self.max_samples:
+            pixels = pixels[:: math.ceil(len(pixels) / self.max_samples)]
+
+        rgb = pixels[:, :3]
+        is_candidate = (pixels[:, 3] >= self._MIN_ALPHA) & ~numpy.all(
+            rgb > self._WHITE_THRESHOLD, axis=1
+        )
+        if is_candidate.any():
+            rgb = rgb[is_candidate]
+
+        shift = 8 - self.bits_per_channel
+        quantized = (rgb >> shift).astype(numpy.int64)
+        bins = (
+            (quantized[:, 0] << (2 * self.bits_per_channel))
+            | (quantized[:, 1] << self.bits_per_channel)
+            | quantized[:, 2]
+        )
+        most_common_bin = numpy.bincount(
+            bins, minlength=1 << (3 * self.bits_per_channel)
+        ).argmax()
+        mean_color = rgb[bins == most_common_bin].mean(axis=0)
+        return (
+            int(round(mean_color[0])),
+            int(round(mean_color[1])),
+            int(round(mean_color[2])),
+        )
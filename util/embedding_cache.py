@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy
+
+from util.atomic_writer import AtomicWriter
+from util.disk_cache import DiskCache
+
+
+class _ModelEmbeddings:
+    """The cached embeddings of one model: a row per text, memory mapped"""
+
+    def __init__(self, index: Dict[bytes, int], dimensions: Optional[int]):
+        self.index = index
+        self.dimensions = dimensions
+        self.embeddings: Optional[numpy.ndarray] = None
+
+
+class EmbeddingCache:
+    """A persistent cache of text embeddings with a size cap, shared across runs.
+
+    The embeddings of every model are stored as three files named by a hash of the
+    model name:
+     1. `<key>.f32` - The raw float32 embeddings, one row per text, memory mapped
+        so only the rows that are used are read.
+     2. `<key>.keys` - The digest of the text of every row, see DiskCache.make_key,
+        in the order of the rows.
+     3. `<key>.json` - The model name and the number of dimensions.
+    New embeddings are appended to the rows, then their digests to the keys, so both
+    files only grow and rows without a digest are never read. Once the files of a
+    model exceed the maximum size, they are rebuilt with only the embeddings of the
+    current lookup. A cache directory must have a single writing process at a time.
+    """
+
+    _EMBEDDINGS_EXT: str = ".f32"
+    _KEYS_EXT: str = ".keys"
+    _METADATA_EXT: str = ".json"
+    _DTYPE = numpy.float32
+    # The size of a SHA-256 digest, see DiskCache.make_key.
+    _DIGEST_SIZE: int = 32
+
+    def __init__(self, cache_dir: str, max_size_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._models: Dict[str, _ModelEmbeddings] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_embeddings(
+        self,
+        model_name: str,
+        texts: List[str],
+        embed: Callable[[List[str]], numpy.ndarray],
+    ) -> numpy.ndarray:
+        """Get the embeddings of the given texts, embedding only the unknown ones
+
+        Args:
+            model_name: The name of the model the embeddings belong to
+            texts: The texts to get the embeddings of
+            embed: Embeds a list of texts with the model, called once with all the
+                texts that are not cached
+
+        Returns: A float32 array with a row per text, in the order of the texts
+        """
+        digests = [bytes.fromhex(DiskCache.make_key(text)) for text in texts]
+        with self._lock:
+            model = self._get_model(model_name)
+            missing_texts: Dict[bytes, str] = {}
+            for digest, text in zip(digests, texts):
+                if digest not in model.index:
+                    missing_texts.setdefault(digest, text)
+            self.hits += len(texts) - len(missing_texts)
+            self.misses += len(missing_texts)
+            if missing_texts:
+                self._append(
+                    model_name,
+                    model,
+                    list(missing_texts.keys()),
+                    numpy.asarray(
+                        embed(list(missing_texts.values())), dtype=self._DTYPE
+                    ),
+                )
+            if not texts:
+                return numpy.zeros((0, model.dimensions or 0), dtype=self._DTYPE)
+            assert model.embeddings is not None
+            rows = [model.index[digest] for digest in digests]
+            embeddings = numpy.array(model.embeddings[rows])
+            if self._get_size(model_name) > self.max_size_bytes:
+                self._rebuild(model_name, model, digests, embeddings)
+            return embeddings
+
+    def stats(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses ({self.cache_dir})"
+
+    def _get_model(self, model_name: str) -> _ModelEmbeddings:
+        if model_name in self._models:
+            return self._models[model_name]
+        model = _ModelEmbeddings(index={}, dimensions=None)
+        try:
+            with open(self._get_filepath(model_name, self._METADATA_EXT)) as file:
+                dimensions: int = json.load(file)["dimensions"]
+            model.dimensions = dimensions
+            with open(self._get_filepath(model_name, self._KEYS_EXT), "rb") as file:
+                keys_data = file.read()
+            row_size = dimensions * numpy.dtype(self._DTYPE).itemsize
+            num_rows = min(
+                len(keys_data) // self._DIGEST_SIZE,
+                os.path.getsize(self._get_filepath(model_name, self._EMBEDDINGS_EXT))
+                // row_size,
+            )
+            for row in range(num_rows):
+                start = row * self._DIGEST_SIZE
+                model.index[keys_data[start : start + self._DIGEST_SIZE]] = row
+        except FileNotFoundError:
+            model = _ModelEmbeddings(index={}, dimensions=None)
+        self._map_embeddings(model_name, model)
+        self._models[model_name] = model
+        return model
+
+    def _append(
+        self,
+        model_name: str,
+        model: _ModelEmbeddings,
+        digests: List[bytes],
+        embeddings: numpy.ndarray,
+    ) -> None:
+        if embeddings.shape[0] != len(digests):
+            raise RuntimeError(
+                f"Expected {len(digests)} embeddings, got {embeddings.shape[0]}"
+            )
+        if model.dimensions is None:
+            model.dimensions = embeddings.shape[1]
+            self._write_metadata(model_name, model)
+        elif embeddings.shape[1] != model.dimensions:
+            raise RuntimeError(
+                f"Expected embeddings of {model.dimensions} dimensions for "
+                f"{model_name}, got {embeddings.shape[1]}"
+            )
+
+        num_rows = len(model.index)
+        row_size = model.dimensions * numpy.dtype(self._DTYPE).itemsize
+        # Overwrite the rows and digests of an append that didn't complete.
+        self._write_at(
+            self._get_filepath(model_name, self._EMBEDDINGS_EXT),
+            num_rows * row_size,
+            embeddings.tobytes(),
+        )
+        self._write_at(
+            self._get_filepath(model_name, self._KEYS_EXT),
+            num_rows * self._DIGEST_SIZE,
+            b"".join(digests),
+        )
+        for row, digest in enumerate(digests, start=num_rows):
+            model.index[digest] = row
+        self._map_embeddings(model_name, model)
+
+    def _rebuild(
+        self,
+        model_name: str,
+        model: _ModelEmbeddings,
+        digests: List[bytes],
+        embeddings: numpy.ndarray,
+    ) -> None:
+        """Replace the embeddings of the model with the given ones only"""
+        print(f"Embedding cache of {model_name} is full, rebuilding it")
+        unique_rows = {digest: row for row, digest in enumerate(digests)}
+        model.index = {}
+        model.embeddings = None
+        for extension in (self._EMBEDDINGS_EXT, self._KEYS_EXT):
+            os.remove(self._get_filepath(model_name, extension))
+        self._append(
+            model_name,
+            model,
+            list(unique_rows.keys()),
+            embeddings[list(unique_rows.values())],
+        )
+
+    def _write_metadata(self, model_name: str, model: _ModelEmbeddings) -> None:
+        metadata_filepath = self._get_filepath(model_name, self._METADATA_EXT)
+        with AtomicWriter.open(metadata_filepath) as file:
+            json.dump({"model": model_name, "dimensions": model.dimensions}, file)
+
+    @staticmethod
+    def _write_at(filepath: str, position: int, data: bytes) -> None:
+        mode = "r+b" if os.path.exists(filepath) else "wb"
+        with open(filepath, mode) as file:
+            file.seek(position)
+            file.write(data)
+            file.truncate()
+
+    def _get_size(self, model_name: str) -> int:
+        return sum(
+            os.path.getsize(self._get_filepath(model_name, extension))
+            for extension in (self._EMBEDDINGS_EXT, self._KEYS_EXT)
+        )
+
+    def _map_embeddings(self, model_name: str, model: _ModelEmbeddings) -> None:
+        if not model.index or model.dimensions is None:
+            model.embeddings = None
+            return
+        model.embeddings = numpy.memmap(
+            self._get_filepath(model_name, self._EMBEDDINGS_EXT),
+            dtype=self._DTYPE,
+            mode="r",
+            shape=(len(model.index), model.dimensions),
+        )
+
+    def _get_filepath(self, model_name: str, extension: str) -> str:
+        return os.path.join(
+            self.cache_dir, f"{DiskCache.make_key(model_name)}{extension}"
+        )
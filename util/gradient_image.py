@@ -1,10 +1,13 @@
+from functools import lru_cache
 from typing import Tuple, Optional
 
-from PIL import Image, ImageDraw
+import numpy
+from PIL import Image
 
 
 class GradientImage:
     _DEFAULT_BACKGROUND_D_FACTOR: float = 0.5
+    _MEMO_SIZE: int = 64
 
     def __init__(
         self,
@@ -17,33 +20,56 @@ class GradientImage:
         self._factor = factor if factor else self._DEFAULT_BACKGROUND_D_FACTOR
 
     def get(self):
-        return self._create()
-
-    def _create(self) -> Image:
-        gradient = Image.new("RGBA", self._size, color=0)
-        draw = ImageDraw.Draw(gradient)
-        for i, color in enumerate(
-            self._interpolate(
-                self._main_color,
-                self._darken_color(self._main_color),
-                self._size[0] + self._size[1],
-            )
-        ):
-            draw.line([(i, 0), (0, i)], tuple(color), width=1)
-        return gradient
-
-    def _darken_color(self, color: Tuple[int, int, int]) -> Tuple[int, int, int]:
+        """Create a diagonal gradient from the color to its darker version
+
+        Every pixel (x, y) gets the color of the diagonal x + y, the diagonals are
+        evenly interpolated over width + height steps.
+        """
+        width, height = self._size
+        ramp = self._create_ramp(tuple(self._main_color), width + height, self._factor)
+        # Row y of the image is the window ramp[y:y + width], a strided view over
+        # the ramp builds all the rows with a single copy.
+        rows = numpy.lib.stride_tricks.as_strided(
+            ramp,
+            shape=(height, width, 4),
+            strides=(ramp.strides[0], ramp.strides[0], ramp.strides[1]),
+            writeable=False,
+        )
+        return Image.fromarray(numpy.ascontiguousarray(rows), "RGBA")
+
+    @classmethod
+    @lru_cache(maxsize=_MEMO_SIZE)
+    def _create_ramp(
+        cls, color: Tuple[int, int, int], length: int, factor: float
+    ) -> numpy.ndarray:
+        """Returns: The RGBA colors of the given number of diagonals. Only the ramp
+        is memoized, it takes a few KB where the image takes MBs."""
+        ramp = numpy.full((length, 4), 255, dtype=numpy.uint8)
+        ramp[:, :3] = cls._interpolate(color, cls._darken_color(color, factor), length)
+        # The memoized ramp is shared.
+        ramp.flags.writeable = False
+        return ramp
+
+    @staticmethod
+    def _darken_color(
+        color: Tuple[int, int, int], factor: float
+    ) -> Tuple[int, int, int]:
         return (
-            int(color[0] - color[0] * self._factor),
-            int(color[1] - color[1] * self._factor),
-            int(color[2] - color[2] * self._factor),
+            int(color[0] - color[0] * factor),
+            int(color[1] - color[1] * factor),
+            int(color[2] - color[2] * factor),
         )
 
     @staticmethod
-    def _interpolate(f_co, t_co, interval):
-        det_co = [(t - f) / interval for f, t in zip(f_co, t_co)]
-        for i in range(interval):
-            yield [round(f + det * i) for f, det in zip(f_co, det_co)]
+    def _interpolate(f_co, t_co, interval) -> numpy.ndarray:
+        det_co = numpy.array(
+            [(t - f) / interval for f, t in zip(f_co, t_co)], dtype=numpy.float64
+        )
+        steps = numpy.arange(interval, dtype=numpy.float64)[:, numpy.newaxis]
+        # numpy.rint rounds half to even, exactly like the built-in round.
+        return numpy.rint(
+            numpy.array(f_co, dtype=numpy.float64) + det_co * steps
+        ).astype(numpy.uint8)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,66 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+from PIL import Image
+
+
+class ImageWriter:
+    """
+    Persist rendered images as files, in one of the following modes:
+     1. sync - Save the image before returning.
+     2. background - Save the image in a background thread, call flush() to wait.
+     3. off - Don't save the image at all, it is only used in memory.
+    """
+
+    MODE_SYNC: str = "sync"
+    MODE_BACKGROUND: str = "background"
+    MODE_OFF: str = "off"
+    MODES: List[str] = [MODE_SYNC, MODE_BACKGROUND, MODE_OFF]
+
+    _DEFAULT_MAX_WORKERS: int = 2
+
+    def __init__(self, mode: str = MODE_SYNC, max_workers: int = _DEFAULT_MAX_WORKERS):
+        if mode not in self.MODES:
+            raise RuntimeError(f"Unknown image writer mode: {mode}")
+        self.mode = mode
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures: List[Future] = []
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # Threads can't be pickled, every process starts its own.
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        state["_futures"] = []
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def write(self, image: Image.Image, filepath: str) -> None:
+        """Save the given image to filepath according to the mode
+
+        Args:
+            image: The image to save, must not be modified after this call
+            filepath: Where to save the image
+        """
+        if self.mode == self.MODE_OFF:
+            return
+        if self.mode == self.MODE_SYNC:
+            image.save(filepath)
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            self._futures.append(self._executor.submit(image.save, filepath))
+
+    def flush(self) -> None:
+        """Wait for all the background writes, raising the first error if any"""
+        with self._lock:
+            futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
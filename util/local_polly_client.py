@@ -0,0 +1,83 @@
+import json
+import re
+from io import BytesIO
+from typing import List, Optional, Tuple
+from xml.sax.saxutils import unescape
+
+
+class LocalPollyClient:
+    """
+    An offline stand-in for the boto3 Polly client.
+
+    It implements the subset of synthesize_speech used by AudioGeneratorPolly. Instead
+    of speech, every piece of text becomes a tone whose length is proportional to the
+    number of characters, and `<mark>` tags produce ssml speech marks at the matching
+    offsets. This keeps the request/response shapes of Polly, so the audio pipeline
+    can run without AWS credentials or network access.
+    """
+
+    _MILLISECONDS_PER_CHARACTER: int = 60
+    _TONE_FREQUENCIES: Tuple[int, int] = (440, 660)
+    _TONE_VOLUME_DB: float = -20.0
+    _OUTPUT_FORMAT_JSON: str = "json"
+    _MARK_PATTERN = re.compile(r'<mark\s+name="([^"]*)"\s*/>')
+    _TAG_PATTERN = re.compile(r"<[^>]+>")
+
+    def synthesize_speech(
+        self,
+        Text: str,
+        OutputFormat: str,
+        TextType: str = "text",
+        SpeechMarkTypes: Optional[List[str]] = None,
+        **kwargs,
+    ) -> dict:
+        segments = self._split_segments(Text, is_ssml=TextType == "ssml")
+
+        if OutputFormat == self._OUTPUT_FORMAT_JSON:
+            speech_marks = []
+            current_time = 0
+            for mark_name, text in segments:
+                if mark_name is not None:
+                    speech_marks.append(
+                        json.dumps(
+                            {"time": current_time, "type": "ssml", "value": mark_name}
+                        )
+                    )
+                current_time += self._get_duration(text)
+            stream = BytesIO("\n".join(speech_marks).encode("utf-8"))
+            return {"AudioStream": stream, "ContentType": "application/x-json-stream"}
+
+        from pydub import AudioSegment
+        from pydub.generators import Sine
+
+        audio = AudioSegment.empty()
+        for i, (_, text) in enumerate(segments):
+            frequency = self._TONE_FREQUENCIES[i % len(self._TONE_FREQUENCIES)]
+            audio += Sine(frequency).to_audio_segment(
+                duration=self._get_duration(text), volume=self._TONE_VOLUME_DB
+            )
+        stream = BytesIO()
+        audio.export(stream, format=OutputFormat)
+        stream.seek(0)
+        return {"AudioStream": stream, "ContentType": "audio/mpeg"}
+
+    def _split_segments(
+        self, text: str, is_ssml: bool
+    ) -> List[Tuple[Optional[str], str]]:
+        """Returns: Pairs of (name of the mark preceding the text or None, plain text)"""
+        if not is_ssml:
+            return [(None, text)]
+        segments: List[Tuple[Optional[str], str]] = []
+        parts = self._MARK_PATTERN.split(text)
+        # re.split alternates between text and the captured mark names.
+        segments.append((None, self._TAG_PATTERN.sub("", parts[0])))
+        for mark_name, part in zip(parts[1::2], parts[2::2]):
+            segments.append((mark_name, self._TAG_PATTERN.sub("", part)))
+        return [
+            (mark_name, segment_text)
+            for mark_name, segment_text in segments
+            if mark_name is not None or segment_text.strip()
+        ]
+
+    def _get_duration(self, text: str) -> int:
+        return len(unescape(text).strip()) * self._MILLISECONDS_PER_CHARACTER
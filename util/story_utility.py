@@ -1,11 +1,31 @@
+import hashlib
+import json
 import os
 import pickle
+import shutil
+import sys
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
-from data_models import StoryContent, CombinedWorkdir
+from data_models import StoryContent, CombinedWorkdir, StoryPageContent, StorySize
+from util.atomic_writer import AtomicWriter
 
 
 class StoryUtility:
+    """
+    Save and load stories. A story is saved as a manifest, a JSON file with the
+    text, size and pages of the story. The page images are referenced by their
+    path, relative to the manifest, and their hash. They are only read when a page
+    needs its image, so loading a story is fast and takes little memory.
+    Stories saved as a pickle file before can still be loaded and converted.
+    """
+
+    MANIFEST_FILENAME: str = "story_manifest.json"
+
+    _MANIFEST_VERSION: int = 1
+    _IMAGES_DIRNAME: str = "images"
+    _IMAGE_EXT: str = ".png"
+
     @staticmethod
     def save_story(workdir: str, story_content: StoryContent) -> None:
         """Save the given story to disk
@@ -16,12 +36,117 @@ class StoryUtility:
 
         Returns: Nothing
         """
-        with open(os.path.join(workdir, f"story_content.pickle"), "wb") as file:
-            pickle.dump(story_content, file)
+        StoryUtility.save_manifest(workdir, story_content)
 
         with open(os.path.join(workdir, f"raw_story.txt"), "w") as f:
             f.write(story_content.raw_text)
 
+    @staticmethod
+    def save_manifest(workdir: str, story_content: StoryContent) -> str:
+        """Save the manifest of the given story. Page images that are not in the
+        images dir of the workdir are copied there, so the workdir is self-contained.
+
+        Args:
+            workdir: The root directory of the story
+            story_content: The contents of the story
+
+        Returns: The manifest filepath
+        """
+        images_dir = os.path.join(workdir, StoryUtility._IMAGES_DIRNAME)
+        os.makedirs(images_dir, exist_ok=True)
+        # The image file of every source image, pages may share an image.
+        image_filepaths: Dict[str, str] = {}
+        pages = []
+        for page_content in story_content.page_contents:
+            source = page_content.image_path
+            if source not in image_filepaths:
+                image_filepaths[source] = StoryUtility._place_image(
+                    images_dir, page_content
+                )
+            image_filepath = image_filepaths[source]
+            with open(image_filepath, "rb") as file:
+                image_sha256 = hashlib.sha256(file.read()).hexdigest()
+            pages.append(
+                {
+                    "sentence": page_content.sentence,
+                    "page_number": page_content.page_number,
+                    "image_path": os.path.relpath(image_filepath, workdir),
+                    "image_sha256": image_sha256,
+                    "dominant_color": page_content.dominant_color,
+                }
+            )
+
+        manifest_filepath = os.path.join(workdir, StoryUtility.MANIFEST_FILENAME)
+        with AtomicWriter.open(manifest_filepath) as file:
+            json.dump(
+                {
+                    "version": StoryUtility._MANIFEST_VERSION,
+                    "story_seed": story_content.story_seed,
+                    "raw_text": story_content.raw_text,
+                    "story_size": story_content.story_size.name,
+                    "pages": pages,
+                },
+                file,
+                indent=2,
+            )
+        return manifest_filepath
+
+    @staticmethod
+    def load_story(story_file: str) -> StoryContent:
+        """Load the given story from a manifest or a pickle file
+
+        Args:
+            story_file: The manifest or the pickle file of a previously generated story
+
+        Returns: The story content
+        """
+        if story_file.endswith(".json"):
+            return StoryUtility.load_story_from_manifest(story_file)
+        return StoryUtility.load_story_from_pickle(story_file)
+
+    @staticmethod
+    def load_story_from_manifest(manifest_file: str) -> StoryContent:
+        """Load the given story from a manifest, without reading its images
+
+        Args:
+            manifest_file: A manifest file of a previously generated story
+
+        Returns: The story content, every page reads its image on first use
+        """
+        print("Loading existing story")
+        with open(manifest_file) as file:
+            manifest = json.load(file)
+        if manifest.get("version") != StoryUtility._MANIFEST_VERSION:
+            raise RuntimeError(
+                f"Unsupported story manifest version: {manifest.get('version')}"
+            )
+
+        workdir = os.path.dirname(manifest_file)
+        page_contents: List[StoryPageContent] = []
+        for page in manifest["pages"]:
+            dominant_color: Optional[Tuple[int, int, int]] = None
+            if page["dominant_color"]:
+                red, green, blue = page["dominant_color"]
+                dominant_color = (red, green, blue)
+            page_contents.append(
+                StoryPageContent(
+                    sentence=page["sentence"],
+                    image=None,
+                    image_path=os.path.normpath(
+                        os.path.join(workdir, page["image_path"])
+                    ),
+                    page_number=page["page_number"],
+                    dominant_color=dominant_color,
+                    image_sha256=page["image_sha256"],
+                )
+            )
+        return StoryContent(
+            story_seed=manifest["story_seed"],
+            raw_text=manifest["raw_text"],
+            page_contents=page_contents,
+            story_size=StorySize[manifest["story_size"]],
+        )
+
     @staticmethod
     def load_story_from_pickle(pickle_file: str) -> StoryContent:
         """Load the given story from pickle file
@@ -33,7 +158,58 @@ class StoryUtility:
         """
         print("Loading existing story")
         with open(pickle_file, "rb") as file:
-            return pickle.load(file)
+            story_content: StoryContent = pickle.load(file)
+
+        # Stories saved before the size was stored, the images are square.
+        if not hasattr(story_content, "story_size"):
+            story_content.story_size = StorySize.get_size_from_str(
+                str(story_content.page_contents[0].get_image().width)
+            )
+        # Stories saved before the workdir was renamed, or moved since.
+        images_dir = os.path.join(
+            os.path.dirname(pickle_file), StoryUtility._IMAGES_DIRNAME
+        )
+        for page_content in story_content.page_contents:
+            local_image_path = os.path.join(
+                images_dir, os.path.basename(page_content.image_path)
+            )
+            if not os.path.isfile(page_content.image_path) and os.path.isfile(
+                local_image_path
+            ):
+                page_content.image_path = local_image_path
+        return story_content
+
+    @staticmethod
+    def convert_pickle_to_manifest(pickle_file: str) -> str:
+        """Save the manifest of a story saved as a pickle file, next to it
+
+        Args:
+            pickle_file: A pickle file for a previously generated story
+
+        Returns: The manifest filepath
+        """
+        story_content = StoryUtility.load_story_from_pickle(pickle_file)
+        return StoryUtility.save_manifest(
+            os.path.dirname(pickle_file) or ".", story_content
+        )
+
+    @staticmethod
+    def _place_image(images_dir: str, page_content: StoryPageContent) -> str:
+        """Returns: The image file of the page in images_dir, copied or saved there
+        if it is elsewhere"""
+        source = page_content.image_path
+        if os.path.isfile(source) and os.path.samefile(
+            os.path.dirname(source), images_dir
+        ):
+            return source
+        image_filepath = os.path.join(
+            images_dir, f"image_{page_content.page_number}{StoryUtility._IMAGE_EXT}"
+        )
+        if os.path.isfile(source):
+            shutil.copyfile(source, image_filepath)
+        else:
+            page_content.get_image().save(image_filepath)
+        return image_filepath
 
     @staticmethod
     def new_workdir(prompt: str) -> CombinedWorkdir:
@@ -67,3 +243,10 @@ class StoryUtility:
         minute = str(now.minute).zfill(2)
         second = str(now.second).zfill(2)
         return f"_stories/{now.year}_{month}_{day}_{hour}_{minute}_{second}-{'_'.join(story_prompt.split(' '))}"
+
+
+if __name__ == "__main__":
+    # Convert stories saved as pickle files, e.g.
+    # python -m util.story_utility _stories/*/story_content.pickle
+    for story_pickle_file in sys.argv[1:]:
+        print(StoryUtility.convert_pickle_to_manifest(story_pickle_file))